@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# End-to-end benchmarks of validate, genver and genoem on synthetic instances
+# folders of several sizes, reporting wall time and peak memory of each flow.
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic import SyntheticParams, generate
+
+VERMINATOR = os.path.join(ROOT_DIR, 'bin', 'verminator')
+
+# name: (instances, majors, releases, product_lines, fanout)
+SIZES = {
+    'small': (20, 2, 5, 3, 2),
+    'medium': (100, 3, 6, 4, 3),
+    'large': (400, 3, 8, 6, 3),
+}
+
+FLOWS = ['validate', 'genver', 'genoem']
+
+
+def _run_flow(flow, folder, next_version, queue):
+    """Run a flow in a fresh process, putting (seconds, peak rss in bytes) into the queue"""
+    cmd_class = runpy.run_path(VERMINATOR)['VerminatorCmd']
+    cmd = cmd_class.__new__(cmd_class)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        if flow == 'validate':
+            cmd._validate_instances(folder)
+        elif flow == 'genver':
+            cmd._create_version(folder, next_version)
+        elif flow == 'genoem':
+            sys.argv = ['verminator', 'genoem', '-o', 'gzes', folder]
+            cmd.genoem()
+        else:
+            raise ValueError('Unknown flow %s' % flow)
+        seconds = time.perf_counter() - start
+    # Kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak *= 1024
+    queue.put((seconds, peak))
+
+
+def bench_flow(flow, origin, next_version, repeat=1):
+    """Run a flow on copies of the origin folder, with the best wall time and the max peak memory"""
+    results = list()
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = os.path.join(tmp, 'instances')
+            shutil.copytree(origin, folder)
+            queue = multiprocessing.Queue()
+            proc = multiprocessing.Process(target=_run_flow, args=(flow, folder, next_version, queue))
+            proc.start()
+            proc.join()
+            if proc.exitcode != 0:
+                raise RuntimeError('Flow %s failed with exit code %s' % (flow, proc.exitcode))
+            results.append(queue.get())
+    return min(r[0] for r in results), max(r[1] for r in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end benchmarks of verminator flows')
+    parser.add_argument('-s', '--sizes', default='small,medium', help='Sizes among %s' % ', '.join(SIZES))
+    parser.add_argument('-f', '--flows', default=','.join(FLOWS), help='Flows among %s' % ', '.join(FLOWS))
+    parser.add_argument('-n', '--repeat', type=int, default=1, help='Runs of each flow, the best taken')
+    parser.add_argument('--json', help='Write results into a json file')
+    args = parser.parse_args()
+
+    results = list()
+    print('{:<8} {:>9} {:>9} {:<9} {:>10} {:>10}'.format('size', 'instances', 'files', 'flow', 'seconds', 'peak MiB'))
+    for size in args.sizes.split(','):
+        instances, majors, releases, product_lines, fanout = SIZES[size]
+        params = SyntheticParams(instances, majors, releases, product_lines, fanout)
+        with tempfile.TemporaryDirectory() as tmp:
+            origin = os.path.join(tmp, 'instances')
+            next_version = generate(origin, params)
+            for flow in args.flows.split(','):
+                seconds, peak = bench_flow(flow, origin, next_version, args.repeat)
+                result = {
+                    'size': size, 'params': params._asdict(), 'flow': flow,
+                    'seconds': seconds, 'peak_bytes': peak,
+                }
+                results.append(result)
+                print('{:<8} {:>9} {:>9} {:<9} {:>10.3f} {:>10.1f}'.format(
+                    size, instances, instances * majors, flow, seconds, peak / 1024.0 / 1024))
+
+    if args.json is not None:
+        with open(args.json, 'w') as of:
+            json.dump(results, of, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# Micro-benchmarks of version primitives, range algebra and release meta queries,
+# reporting ops/sec and memory allocated per call against a saved baseline.
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic import SyntheticParams, generate
+from verminator import utils
+from verminator.batch import HAS_NUMPY, in_ranges_matrix
+from verminator.releasemeta import ProductReleaseMeta
+from verminator.utils import *
+
+BASELINE_SCHEMA = 1
+
+# Products besides the OEM ones, and the OEM prefixes
+PRODUCTS = ['transwarp', 'tos', 'sophon', 'argodb']
+OEMS = ['tdc', 'gzes']
+
+
+def _product_line(rnd, prefix, builds=False):
+    """Ordered versions of a product line, rc and final releases, or build numbers"""
+    versions = list()
+    for major in range(1, 4):
+        for minor in range(rnd.randint(2, 4)):
+            for maintenance in range(rnd.randint(1, 3)):
+                base = '{}-{}.{}.{}'.format(prefix, major, minor, maintenance)
+                if builds:
+                    versions.extend('{}.{}'.format(base, b) for b in range(rnd.randint(1, 5)))
+                else:
+                    versions.extend('{}-rc{}'.format(base, k) for k in range(1, rnd.randint(2, 5)))
+                    versions.append(base + '-final')
+    return versions
+
+
+class Corpus(object):
+    """Realistic versions and version ranges, generated from a seed"""
+
+    def __init__(self, seed=0):
+        rnd = random.Random(seed)
+        self.lines = [_product_line(rnd, p) for p in PRODUCTS + OEMS]
+        self.lines.append(_product_line(rnd, 'guardian', builds=True))
+        self.strings = [v for line in self.lines for v in line]
+        rnd.shuffle(self.strings)
+        self.versions = [parse_version(v) for v in self.strings]
+
+        def vrange(line):
+            a = rnd.randrange(len(line))
+            b = min(a + rnd.randrange(6), len(line) - 1)
+            return parse_version(line[a]), parse_version(line[b])
+
+        # Pairs of ranges of the same product line
+        self.range_pairs = list()
+        for _ in range(500):
+            line = rnd.choice(self.lines)
+            self.range_pairs.append((vrange(line), vrange(line)))
+
+        # Lists of ranges of a few product lines to merge
+        self.range_lists = list()
+        for _ in range(200):
+            lines = rnd.sample(self.lines, 3)
+            self.range_lists.append([vrange(rnd.choice(lines)) for _ in range(rnd.randint(2, 10))])
+
+        # Versions looked up in ranges of the product line
+        self.lookups = list()
+        for _ in range(500):
+            line = rnd.choice(self.lines)
+            self.lookups.append((parse_version(rnd.choice(line)), [vrange(line) for _ in range(8)]))
+
+        # Batches of all versions of a product line against its ranges
+        self.batches = list()
+        for _ in range(10):
+            line = rnd.choice(self.lines)
+            self.batches.append(([parse_version(v) for v in line], [vrange(line) for _ in range(50)]))
+
+
+def _meta_corpus(tmp, seed=0):
+    """A synthetic release meta and product versions declared in it"""
+    generate(tmp, SyntheticParams(instances=40, majors=3, releases=8, product_lines=4, seed=seed))
+    meta = ProductReleaseMeta(os.path.join(tmp, 'releases_meta.yaml'))
+    versions = set()
+    for release_ver, products in meta.get_releases().items():
+        versions.add(release_ver)
+        for minv, maxv in products.values():
+            versions.update((minv, maxv))
+    return meta, sorted_versions(versions)
+
+
+def benchmarks(corpus, meta, meta_versions):
+    """[(name, setup called before each pass, function, [args])]"""
+    def clear_versions():
+        utils._version_cache.clear()
+
+    def clear_meta():
+        meta._compatible_versions_cache.clear()
+
+    def warm_meta():
+        # Cache hits only in the timed pass, even after the cache cleared by cold entries
+        for v in meta_versions:
+            meta.get_compatible_versions(v)
+
+    def noop():
+        pass
+
+    return [
+        ('parse_version', noop, parse_version, corpus.strings),
+        ('parse_version[cold]', clear_versions, parse_version, corpus.strings),
+        ('to_major_version', noop, to_major_version, corpus.versions),
+        ('to_major_version[str]', noop, to_major_version, corpus.strings),
+        ('filter_vrange', noop, lambda a: filter_vrange(*a), corpus.range_pairs),
+        ('concatenate_vranges', noop, concatenate_vranges, corpus.range_lists),
+        ('concatenate_vranges[hard]', noop, lambda a: concatenate_vranges(a, True), corpus.range_lists),
+        ('check_version_in_vranges_list', noop, lambda a: check_version_in_vranges_list(*a), corpus.lookups),
+        ('get_compatible_versions', warm_meta, meta.get_compatible_versions, meta_versions),
+        ('get_compatible_versions[cold]', clear_meta, meta.get_compatible_versions, meta_versions),
+        ('get_tdc_version_range[cold]', clear_meta, meta.get_tdc_version_range, meta_versions),
+        ('in_ranges_matrix[python]', noop, lambda a: in_ranges_matrix(*a, vectorized=False), corpus.batches),
+    ] + ([
+        ('in_ranges_matrix[numpy]', noop, lambda a: in_ranges_matrix(*a, vectorized=True), corpus.batches),
+    ] if HAS_NUMPY else [])
+
+
+def time_bench(setup, func, args, min_time=0.2, repeat=5):
+    """Best ops/sec of repeats, each running passes over args for at least min_time seconds"""
+    best = 0.0
+    for _ in range(repeat):
+        calls, elapsed = 0, 0.0
+        while elapsed < min_time:
+            setup()
+            start = time.perf_counter()
+            for a in args:
+                func(a)
+            elapsed += time.perf_counter() - start
+            calls += len(args)
+        best = max(best, calls / elapsed)
+    return best
+
+
+def trace_bench(setup, func, args):
+    """
+    Memory allocated per call traced by tracemalloc, averaged over a pass:
+    (peak bytes allocated during a call, bytes still held after the call).
+    """
+    setup()
+    gc.collect()
+    peak_total, retained_total = 0, 0
+    tracemalloc.start()
+    try:
+        for a in args:
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            else:
+                # Python < 3.9, restarting clears the peak
+                tracemalloc.stop()
+                tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            func(a)
+            current, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - before
+            retained_total += current - before
+    finally:
+        tracemalloc.stop()
+    return peak_total / len(args), retained_total / len(args)
+
+
+def _compare(results, baseline, tolerance):
+    """Print changes against the baseline, return the names of slower benchmarks"""
+    slower = list()
+    print('\n{:<32} {:>14} {:>14} {:>9}'.format('vs baseline', 'ops/s', 'baseline', 'change'))
+    for name, res in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print('{:<32} {:>14.0f} {:>14} {:>9}'.format(name, res['ops'], '-', 'new'))
+            continue
+        change = res['ops'] / base['ops'] - 1
+        flag = ''
+        if change < -tolerance:
+            flag = ' SLOWER'
+            slower.append(name)
+        print('{:<32} {:>14.0f} {:>14.0f} {:>+8.1%}{}'.format(name, res['ops'], base['ops'], change, flag))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of verminator primitives')
+    parser.add_argument('-k', '--filter', help='Only run benchmarks with names containing this')
+    parser.add_argument('-t', '--min-time', type=float, default=0.2, help='Min seconds of each timing')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='Timings of each benchmark, the best taken')
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('--save', help='Save results as the baseline json file')
+    parser.add_argument('--compare', help='Compare results with the baseline json file')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Relative slowdown against the baseline to fail, 0.1 by default')
+    args = parser.parse_args()
+
+    corpus = Corpus(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        meta, meta_versions = _meta_corpus(tmp, args.seed)
+
+    results = dict()
+    print('{:<32} {:>6} {:>14} {:>12} {:>12}'.format('benchmark', 'inputs', 'ops/s', 'peak B/call', 'kept B/call'))
+    for name, setup, func, inputs in benchmarks(corpus, meta, meta_versions):
+        if args.filter is not None and args.filter not in name:
+            continue
+        ops = time_bench(setup, func, inputs, args.min_time, args.repeat)
+        peak, retained = trace_bench(setup, func, inputs)
+        results[name] = {'inputs': len(inputs), 'ops': ops, 'peak_bytes': peak, 'retained_bytes': retained}
+        print('{:<32} {:>6} {:>14.0f} {:>12.0f} {:>12.0f}'.format(name, len(inputs), ops, peak, retained))
+
+    if args.save is not None:
+        with open(args.save, 'w') as of:
+            json.dump({
+                'schema': BASELINE_SCHEMA,
+                'python': platform.python_version(),
+                'seed': args.seed,
+                'results': results,
+            }, of, indent=2, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare) as ifile:
+            baseline = json.load(ifile)
+        if baseline.get('schema') != BASELINE_SCHEMA:
+            sys.exit('Unsupported baseline schema {}'.format(baseline.get('schema')))
+        if baseline.get('seed') != args.seed:
+            print('Warning: baseline generated with seed {}'.format(baseline.get('seed')))
+        if _compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
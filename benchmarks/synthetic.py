@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# Deterministic generator of synthetic product-meta: an instances folder with
+# images.yaml of each versioned instance and the releases_meta.yaml.
+import argparse
+import os
+import random
+from collections import namedtuple
+
+import yaml
+
+__all__ = ['SyntheticParams', 'generate']
+
+SyntheticParams = namedtuple('SyntheticParams', [
+    'instances',  # number of instances
+    'majors',  # major versions per instance
+    'releases',  # releases per major version
+    'product_lines',  # number of product lines besides the OEM (tdc) one
+    'fanout',  # dependencies of each release
+    'oem',  # the OEM (tdc) prefix
+    'seed',
+])
+SyntheticParams.__new__.__defaults__ = (20, 2, 5, 3, 2, 'tdc', 0)
+
+
+def _product_versions(product, majors, releases):
+    """All versions of a product line, [(major_version, [versions])]"""
+    return [('{}.0'.format(m + 1), ['{}-{}.0.{}-final'.format(product, m + 1, k) for k in range(releases)])
+            for m in range(majors)]
+
+
+def _flatten(versions):
+    return [v for _, vs in versions for v in vs]
+
+
+def generate(root, params=SyntheticParams()):
+    """
+    Generate a synthetic instances folder.
+
+    Each product line has `majors * releases` versions and so many OEM releases are
+    declared in the meta, the t-th of which is compatible with the t-th and the next
+    versions of each product line. Instances are assigned to product lines in turn,
+    the last of which is the OEM one, with releases depending on the next `fanout`
+    instances. The next version of the first product line is declared in the meta
+    too, to be created by genver.
+
+    :return: the next version of the first product line.
+    """
+    rnd = random.Random(params.seed)
+    products = ['product{}'.format(i) for i in range(params.product_lines)] + [params.oem]
+    versions = dict((p, _product_versions(p, params.majors, params.releases)) for p in products)
+    next_version = '{}-{}.0.{}-final'.format(products[0], params.majors, params.releases)
+
+    # Releases meta
+    meta_releases = list()
+    oem_versions = _flatten(versions[params.oem])
+    for t, oem_version in enumerate(oem_versions):
+        constraints = list()
+        for p in products[:-1]:
+            pvs = _flatten(versions[p])
+            minv, maxv = pvs[min(t, len(pvs) - 1)], pvs[min(t + 1, len(pvs) - 1)]
+            if p == products[0] and t == len(oem_versions) - 1:
+                maxv = next_version
+            constraints.append({'min': minv, 'max': maxv})
+        meta_releases.append({'release_name': oem_version, 'products': constraints})
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'releases_meta.yaml'), 'w') as of:
+        yaml.safe_dump({'Releases': meta_releases}, of, default_flow_style=False)
+
+    # Instances
+    instance_products = dict()
+    for i in range(params.instances):
+        instance_products['instance{}'.format(i)] = products[i % len(products)]
+    names = sorted(instance_products)
+    for i, name in enumerate(names):
+        product = instance_products[name]
+        deps = [names[(i + j + 1) % len(names)] for j in range(min(params.fanout, len(names) - 1))]
+        for major_version, vs in versions[product]:
+            releases = list()
+            for v in vs + ['{}-{}'.format(product, major_version)]:
+                is_major = v.count('.') == 1
+                dependencies = list()
+                for dep in deps:
+                    dep_versions = _flatten(versions[instance_products[dep]])
+                    a = rnd.randrange(len(dep_versions))
+                    b = min(a + rnd.randrange(2), len(dep_versions) - 1)
+                    minv, maxv = dep_versions[a], dep_versions[b]
+                    if is_major:
+                        minv = maxv = minv.rsplit('.', 1)[0]
+                    dependencies.append({'max-version': maxv, 'min-version': minv, 'type': dep})
+                releases.append({
+                    'release-version': v,
+                    'image-version': {name + '_image': v, 'guardian_image': v},
+                    'dependencies': dependencies,
+                    'final': not is_major,
+                })
+            dat = {
+                'instance-type': name,
+                'major-version': major_version,
+                'min-tdc-version': oem_versions[0],
+                'max-tdc-version': oem_versions[0],
+                'hot-fix-ranges': [{'min': vs[0], 'max': vs[-1]}],
+                'images': [
+                    {'name': name, 'variable': name + '_image', 'role': name},
+                    {'name': 'guardian', 'variable': 'guardian_image'},
+                ],
+                'releases': releases,
+            }
+            folder = os.path.join(root, name, major_version)
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, 'images.yaml'), 'w') as of:
+                yaml.safe_dump(dat, of, default_flow_style=False)
+    return next_version
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic instances folder')
+    parser.add_argument('-i', '--instances', type=int, default=SyntheticParams().instances)
+    parser.add_argument('-m', '--majors', type=int, default=SyntheticParams().majors)
+    parser.add_argument('-r', '--releases', type=int, default=SyntheticParams().releases)
+    parser.add_argument('-p', '--product-lines', type=int, default=SyntheticParams().product_lines)
+    parser.add_argument('-f', '--fanout', type=int, default=SyntheticParams().fanout)
+    parser.add_argument('-o', '--oem', default=SyntheticParams().oem)
+    parser.add_argument('-s', '--seed', type=int, default=SyntheticParams().seed)
+    parser.add_argument('instance_folder', help='The instances folder to create')
+    args = parser.parse_args()
+    params = SyntheticParams(args.instances, args.majors, args.releases, args.product_lines,
+                             args.fanout, args.oem, args.seed)
+    print('Next version declared: {}'.format(generate(args.instance_folder, params)))
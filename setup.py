@@ -25,10 +25,12 @@
 # NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import os
+import re
 
 from setuptools import setup, find_packages
 
-__version__ = '1.3.5'
+with open(os.path.join(os.path.dirname(__file__), 'verminator', '__init__.py')) as ifile:
+    __version__ = re.search(r"^__version__ = '(.*)'$", ifile.read(), re.M).group(1)
 
 
 def walk_path_files(directory, target_folder=None):
@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+from verminator.batch import *
+from verminator.utils import *
+
+
+class BatchCase(unittest.TestCase):
+
+    def setUp(self):
+        self.versions = [parse_version(v) for v in [
+            'tdc-2.0.0-rc0', 'tdc-2.0.0-rc2', 'tdc-2.0.0-final', 'tdc-2.1.0-final', 'tdc-2.1',
+            'transwarp-5.2.2-final', 'transwarp-5.2', '5.2.2', 'guardian-1.0.0.3', 'tdc-2.0.0']]
+        self.vranges = [(parse_version(minv), parse_version(maxv)) for minv, maxv in [
+            ('tdc-2.0.0-rc1', 'tdc-2.0.0-final'), ('tdc-2.0', 'tdc-2.1'), ('tdc-2.0.0-rc0', 'tdc-2.1.0-final'),
+            ('transwarp-5.2.1-final', 'transwarp-5.2.3-final'), ('5.2.0', '5.2.9'),
+            ('guardian-1.0.0.1', 'guardian-1.0.0.5'), ('tdc-2.0.0-final', 'tos-1.0.0-final')]]
+        self.expected = [[v.in_range(minv, maxv) for minv, maxv in self.vranges] for v in self.versions]
+
+    def test_python(self):
+        self.assertTrue(in_ranges_matrix(self.versions, self.vranges, vectorized=False) == self.expected)
+        self.assertTrue(any_in_ranges(self.versions, self.vranges, vectorized=False) ==
+                        [any(column) for column in zip(*self.expected)])
+        pairs = [(v, vrange) for v in self.versions for vrange in self.vranges]
+        self.assertTrue(in_range_pairs([v for v, _ in pairs], [r for _, r in pairs], vectorized=False) ==
+                        [found for row in self.expected for found in row])
+
+    @unittest.skipUnless(HAS_NUMPY, 'NumPy is not installed')
+    def test_numpy(self):
+        self.assertTrue(in_ranges_matrix(self.versions, self.vranges, vectorized=True) == self.expected)
+        self.assertTrue(any_in_ranges(self.versions, self.vranges, vectorized=True) ==
+                        any_in_ranges(self.versions, self.vranges, vectorized=False))
+        pairs = [(v, vrange) for v in self.versions for vrange in self.vranges]
+        self.assertTrue(in_range_pairs([v for v, _ in pairs], [r for _, r in pairs], vectorized=True) ==
+                        [found for row in self.expected for found in row])
+        with self.assertRaises(ValueError):
+            in_ranges_matrix(['tdc-2.0.0-final'], [('tdc-2.1.0-final', 'tdc-2.0.0-final')], vectorized=True)
+
+    def test_lazy_numpy(self):
+        # NumPy is not imported until a batch is vectorized
+        code = 'import sys, verminator.verminator, verminator.batch as b; assert "numpy" not in sys.modules; ' \
+               'b.in_ranges_matrix(["tdc-2.0.0-final"], [("tdc-2.0.0-rc0", "tdc-2.1.0-final")]); ' \
+               'assert "numpy" not in sys.modules'
+        env = dict(os.environ, PYTHONPATH=str(Path(__file__).parent.parent))
+        self.assertTrue(subprocess.run([sys.executable, '-c', code], env=env).returncode == 0)
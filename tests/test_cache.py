@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from verminator.cache import ParseCache
+from verminator.utils import *
+
+
+class ParseCacheCase(unittest.TestCase):
+
+    def setUp(self):
+        this_file = Path(__file__)
+        self.versioned_instance_yml = this_file.parent.joinpath('releasesmeta/versioned_instance.yml')
+
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as root:
+            yaml_file = Path(root).joinpath('images.yaml')
+            shutil.copy(str(self.versioned_instance_yml), str(yaml_file))
+            data = yaml_load(open(str(yaml_file)))
+
+            cache = ParseCache(Path(root).joinpath('cache'))
+            self.assertTrue(cache.load(yaml_file) == data)
+            self.assertTrue(cache.load(yaml_file) == data)
+            self.assertTrue((cache.hits, cache.misses) == (1, 1))
+
+            # Parsed again once changed
+            for entry in cache.cache_dir.iterdir():
+                os.utime(str(entry), (0, 0))
+            with open(str(yaml_file), 'a') as of:
+                of.write('extra: 1\n')
+            self.assertTrue(cache.load(yaml_file)['extra'] == 1)
+            self.assertTrue((cache.hits, cache.misses) == (1, 2))
+
+            # Evicting least recently used entries
+            entries = list(cache.cache_dir.iterdir())
+            self.assertTrue(len(entries) == 2)
+            cache.max_size = max(os.path.getsize(str(e)) for e in entries)
+            cache.prune()
+            self.assertTrue(len(list(cache.cache_dir.iterdir())) == 1)
+            self.assertTrue(cache.load(yaml_file)['extra'] == 1)
+            self.assertTrue((cache.hits, cache.misses) == (2, 2))
+
+    def test_broken_entry(self):
+        with tempfile.TemporaryDirectory() as root:
+            yaml_file = Path(root).joinpath('images.yaml')
+            shutil.copy(str(self.versioned_instance_yml), str(yaml_file))
+            data = yaml_load(open(str(yaml_file)))
+
+            cache = ParseCache(Path(root).joinpath('cache'))
+            cache.load(yaml_file)
+            entry = next(cache.cache_dir.iterdir())
+            # A pickle of a class missing now, and a truncated pickle
+            for content in (b'\x80\x03cverminator.missing\nMissing\nq\x00.', entry.read_bytes()[:10]):
+                entry.write_bytes(content)
+                self.assertTrue(cache.load(yaml_file) == data)
+                self.assertTrue(cache.load(yaml_file) == data)
+            self.assertTrue((cache.hits, cache.misses) == (2, 3))
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from verminator.compiler import *
+from verminator.compiler import SCHEMA
+from verminator.releasemeta import ProductReleaseMeta
+
+
+class CompilerCase(unittest.TestCase):
+
+    def setUp(self):
+        this_file = Path(__file__)
+        self.tdc3ex_yml = this_file.parent.joinpath('releasesmeta/tdc3ex.yml')
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_compile(self):
+        meta = ProductReleaseMeta(self.tdc3ex_yml)
+        digest = meta_digest(self.tdc3ex_yml)
+        matrix = compile_matrix(meta, digest)
+        # Instance overlays keep only rows differing from the general one
+        overlays = dict((o['instance'], o) for o in matrix['overlays'])
+        self.assertTrue(len(overlays[None]['rows']) == len(matrix['releases']))
+        self.assertTrue(len(overlays['tdh-metrics-exporter']['rows']) < len(matrix['releases']))
+
+        lookup = CompatibilityMatrix(matrix)
+        for i in matrix['releases']:
+            version = matrix['versions'][i]
+            for instance in [None, 'tdh-metrics-exporter', 'workflow', 'unknown']:
+                expected = meta.get_compatible_versions(version, instance_name=instance)
+                self.assertTrue(lookup.lookup(version, instance) == dict(
+                    (str(p), [(str(v1), str(v2)) for v1, v2 in vranges]) for p, vranges in expected.items()))
+        self.assertTrue(lookup.lookup('transwarp-9.9.9-final') is None)
+
+    def test_roundtrip(self):
+        matrix = compile_matrix(ProductReleaseMeta(self.tdc3ex_yml), meta_digest(self.tdc3ex_yml))
+        for name, binary in (('matrix.json', False), ('matrix.bin', True)):
+            path = os.path.join(self.root, name)
+            write_matrix(matrix, path, binary)
+            self.assertTrue(load_matrix(path) == matrix)
+            self.assertTrue(matrix_stamp(path) == (SCHEMA, matrix['meta_digest'], matrix['oem']))
+        self.assertTrue(matrix_stamp(os.path.join(self.root, 'missing.bin')) is None)
@@ -0,0 +1,44 @@
+import io
+import json
+import unittest
+from contextlib import redirect_stdout
+
+from verminator.diagnostics import Diagnostic, diagnostics
+from verminator.utils import *
+
+
+class DiagnosticsCase(unittest.TestCase):
+
+    def setUp(self):
+        diagnostics.clear()
+
+    def tearDown(self):
+        diagnostics.echo = False
+        diagnostics.clear()
+
+    def test_report(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            # Collected silently by default
+            diagnostics.warn('terminal-image', 'WARNING: set terminal image of {} as {}',
+                             parse_version('argodb-1.0.0-final'), parse_version('tdc-2.0.0-final'),
+                             instance='terminal', major_version='1.0', release='argodb-1.0.0-final')
+            diagnostics.echo = True
+            diagnostics.warn('terminal-image', 'WARNING: set terminal image of {} as {}',
+                             'argodb-1.0.1-final', 'tdc-2.0.1-final', instance='terminal')
+        self.assertTrue(output.getvalue() == 'WARNING: set terminal image of argodb-1.0.1-final as tdc-2.0.1-final\n')
+        self.assertTrue(diagnostics.counts['terminal-image'] == 2)
+        self.assertTrue(diagnostics.summary() == ['2 diagnostic(s) reported', '  terminal-image: 2'])
+        self.assertTrue(diagnostics.summary(1) == [
+            '2 diagnostic(s) reported', '  terminal-image: 2',
+            '    WARNING: set terminal image of argodb-1.0.0-final as tdc-2.0.0-final'])
+
+        stream = io.StringIO()
+        diagnostics.write_jsonl(stream)
+        events = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertTrue(events[0] == {
+            'code': 'terminal-image', 'instance': 'terminal', 'major_version': '1.0',
+            'release': 'argodb-1.0.0-final',
+            'message': 'WARNING: set terminal image of argodb-1.0.0-final as tdc-2.0.0-final'})
+        self.assertTrue(events[1]['major_version'] is None)
+        self.assertTrue(Diagnostic.from_dict(events[0]).to_dict() == events[0])
@@ -0,0 +1,190 @@
+import copy
+import io
+import json
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from verminator.config import verminator_config
+from verminator.diagnostics import diagnostics
+from verminator.incremental import *
+from verminator.profiling import profiler
+from verminator.releasemeta import ProductReleaseMeta
+from verminator.utils import *
+from verminator.validate_release_dep import ReleaseInfo, validate_dependence_versions
+from verminator.verminator import InstanceTree
+
+
+class MetaFingerprintCase(unittest.TestCase):
+
+    def setUp(self):
+        this_file = Path(__file__)
+        self.tdc3ex_yml = this_file.parent.joinpath('releasesmeta/tdc3ex.yml')
+        self.raw_data = yaml_load(open(self.tdc3ex_yml))
+
+    def get_release(self, raw_data, release_name, instance_name=None):
+        for r in raw_data['Releases']:
+            if r['release_name'] == release_name and r.get('instance') == instance_name:
+                return r
+
+    def test_digest(self):
+        fp = MetaFingerprint(self.raw_data)
+        changed = copy.deepcopy(self.raw_data)
+        self.get_release(changed, 'sophonweb-2.2.0-final')['products'][0]['max'] = 'transwarp-5.2.4-final'
+        changed_fp = MetaFingerprint(changed)
+
+        self.assertTrue(fp.digest(['tos'], 'tos') == changed_fp.digest(['tos'], 'tos'))
+        self.assertTrue(fp.digest(['sophonweb'], 'sophon') != changed_fp.digest(['sophonweb'], 'sophon'))
+        self.assertTrue(fp.digest(['transwarp'], 'hdfs') != changed_fp.digest(['transwarp'], 'hdfs'))
+
+        # Instance-specific releases
+        changed = copy.deepcopy(self.raw_data)
+        self.get_release(changed, 'sophonweb-2.2.1-final', 'workflow')['products'][0]['min'] = \
+            'transwarp-5.2.3-final'
+        changed_fp = MetaFingerprint(changed)
+        self.assertTrue(fp.digest(['sophonweb'], 'sophon') == changed_fp.digest(['sophonweb'], 'sophon'))
+        self.assertTrue(fp.digest(['sophonweb'], 'workflow') != changed_fp.digest(['sophonweb'], 'workflow'))
+
+        # New tdc releases affect all
+        changed = copy.deepcopy(self.raw_data)
+        changed['Releases'].append({'release_name': 'tdc-2.0.0-rc4', 'products': list()})
+        changed_fp = MetaFingerprint(changed)
+        self.assertTrue(fp.digest(['tos'], 'tos') != changed_fp.digest(['tos'], 'tos'))
+        self.assertTrue(fp.digest([None], 'zookeeper') != changed_fp.digest([None], 'zookeeper'))
+
+
+def _images(instance, major_version, versions, deps=()):
+    """Images data of a versioned instance, with releases of versions and a major version"""
+    releases = list()
+    for v in versions + [major_version]:
+        is_major = v == major_version
+        dependencies = list()
+        for dep_type, minv, maxv in deps:
+            if is_major:
+                minv = maxv = str(to_major_version(minv))
+            dependencies.append({'max-version': maxv, 'min-version': minv, 'type': dep_type})
+        releases.append({'release-version': v, 'image-version': {instance + '_image': v},
+                         'dependencies': dependencies, 'final': not is_major})
+    return {
+        'instance-type': instance,
+        'major-version': str(parse_version(major_version).major) + '.' + str(parse_version(major_version).minor),
+        'min-tdc-version': 'tdc-2.0.0-rc0',
+        'max-tdc-version': 'tdc-2.0.0-rc3',
+        'hot-fix-ranges': [{'min': versions[0], 'max': versions[-1]}],
+        'images': [{'name': instance, 'variable': instance + '_image', 'role': instance}],
+        'releases': releases,
+    }
+
+
+class IncrementalValidationCase(unittest.TestCase):
+
+    def setUp(self):
+        this_file = Path(__file__)
+        self.root = Path(tempfile.mkdtemp())
+        self.instances = self.root.joinpath('instances')
+        self.instances.mkdir()
+        shutil.copy(str(this_file.parent.joinpath('releasesmeta/tdc3ex.yml')),
+                    str(self.instances.joinpath('releases_meta.yaml')))
+        transwarp = ['transwarp-5.2.1-final', 'transwarp-5.2.2-final', 'transwarp-5.2.3-final']
+        sophon = ['sophonweb-2.2.0-final', 'sophonweb-2.2.1-final']
+        tw_dep = ('transwarp-5.2.1-final', 'transwarp-5.2.3-final')
+        self.write_images('zookeeper', _images('zookeeper', 'transwarp-5.2', transwarp))
+        self.write_images('hdfs', _images('hdfs', 'transwarp-5.2', transwarp, [('zookeeper',) + tw_dep]))
+        self.write_images('sophon', _images('sophon', 'sophonweb-2.2', sophon, [('hdfs',) + tw_dep]))
+        self.write_images('workflow', _images('workflow', 'sophonweb-2.2', sophon, [('sophon',) + tuple(sophon)]))
+        self.options = {'oem': None, 'omit_sample': False, 'sync_releases': True,
+                        'enable_terminal_constraint': False, 'dump': True}
+        self.manifest = self.root.joinpath('manifest.json')
+        # Settle fixes of the tree, validated as unchanged from now on
+        self.validate(self.manifest)
+        self.validate(self.manifest)
+
+    def tearDown(self):
+        shutil.rmtree(str(self.root))
+        ReleaseInfo.clear()
+        diagnostics.clear()
+        profiler.reset()
+
+    def write_images(self, instance, images):
+        folder = self.instances.joinpath(instance, images['major-version'])
+        folder.mkdir(parents=True, exist_ok=True)
+        ordered_yaml_dump(images, open(str(folder.joinpath('images.yaml')), 'w'), default_flow_style=False)
+
+    def validate(self, manifest_file, options=None):
+        """
+        Validate the tree incrementally as `verminator validate -m`.
+
+        :return: (output, diagnostics, [(instance, major_version) validated], instances affected)
+        """
+        options = options or self.options
+        verminator_config.set_oem(options['oem'])
+        ReleaseInfo.clear()
+        diagnostics.clear()
+        profiler.reset()
+        profiler.enable()
+        output = io.StringIO()
+        echo, diagnostics.echo = diagnostics.echo, False
+        try:
+            with redirect_stdout(output):
+                tree = InstanceTree(self.instances)
+                meta = ProductReleaseMeta(self.instances.joinpath('releases_meta.yaml'))
+                manifest = ValidationManifest(manifest_file, options)
+                names = sorted(p.name for p in self.instances.iterdir() if p.is_dir())
+                validate_instances_incrementally(tree, names, meta, manifest, options['sync_releases'],
+                                                 options['enable_terminal_constraint'], options['dump'])
+                affected = scan_instance_tree_incrementally(tree, manifest)
+                validate_dependence_versions(affected)
+                manifest.save()
+        finally:
+            diagnostics.echo = echo
+        validated = sorted((t.instance, t.major_version) for t in profiler.timings if t.phase == 'validate')
+        return output.getvalue(), [e.to_dict() for e in diagnostics.events], validated, affected
+
+    def test_unchanged(self):
+        output, events, validated, affected = self.validate(self.manifest)
+        self.assertTrue(validated == [])
+        self.assertTrue(affected == set())
+        # The same as validating all
+        full_output, full_events, full_validated, _ = self.validate(self.root.joinpath('full.json'))
+        self.assertTrue(len(full_validated) == 4)
+        self.assertTrue(output == full_output)
+        self.assertTrue(events == full_events)
+
+        # Diagnostics recorded for unchanged versioned instances are reported again
+        recorded = [{'code': 'tdc-range-not-found', 'instance': 'hdfs', 'major_version': '5.2',
+                     'release': 'transwarp-5.2.1-final', 'message': 'Warning: recorded'}]
+        dat = json.load(open(str(self.manifest)))
+        dat['validated']['hdfs']['5.2']['diagnostics'] = recorded
+        json.dump(dat, open(str(self.manifest), 'w'))
+        output, events, validated, affected = self.validate(self.manifest)
+        self.assertTrue(validated == [])
+        self.assertTrue(events == recorded)
+
+    def test_changed(self):
+        image_file = self.instances.joinpath('hdfs', '5.2', 'images.yaml')
+        content = open(str(image_file)).read()
+        self.assertTrue('hdfs_image: transwarp-5.2.1-final\n' in content)
+        open(str(image_file), 'w').write(content.replace('hdfs_image: transwarp-5.2.1-final\n',
+                                                         'hdfs_image: transwarp-5.2.1-final-patched\n'))
+        output, events, validated, affected = self.validate(self.manifest)
+        self.assertTrue(validated == [('hdfs', '5.2')])
+        self.assertTrue(affected == {'hdfs'})
+
+        # Constraints specific to an instance affect the instance only
+        meta_file = self.instances.joinpath('releases_meta.yaml')
+        meta = yaml_load(open(str(meta_file)))
+        for r in meta['Releases']:
+            if r.get('instance') == 'workflow':
+                r['products'][0]['min'] = 'transwarp-5.2.3-final'
+        ordered_yaml_dump(meta, open(str(meta_file), 'w'), default_flow_style=False)
+        output, events, validated, affected = self.validate(self.manifest)
+        self.assertTrue(validated == [('workflow', '2.2')])
+
+    def test_options_changed(self):
+        options = dict(self.options, sync_releases=False)
+        output, events, validated, affected = self.validate(self.manifest, options)
+        self.assertTrue(len(validated) == 4)
+        output, events, validated, affected = self.validate(self.manifest, options)
+        self.assertTrue(validated == [])
@@ -0,0 +1,41 @@
+import unittest
+
+from verminator.memory import MemoryLimitError, memory_tracker
+from verminator.profiling import profiler
+from verminator.utils import *
+
+
+class MemoryCase(unittest.TestCase):
+
+    def setUp(self):
+        memory_tracker.reset()
+
+    def tearDown(self):
+        memory_tracker.reset()
+
+    def test_phases(self):
+        memory_tracker.start()
+        held = list()
+        with profiler.phase('load'):
+            with profiler.phase('parse'):
+                held.append([parse_version('tdc-{}.0.0-final'.format(i)) for i in range(1000)])
+            garbage = [str(i) * 10 for i in range(10000)]
+            del garbage
+        self.assertTrue(profiler.timings == [])
+        calls, peak, retained = memory_tracker.phases['load']
+        self.assertTrue(calls == 1)
+        # The peak includes garbage released, and folds the nested one
+        self.assertTrue(peak > retained > 0)
+        self.assertTrue(peak >= memory_tracker.phases['parse'][1])
+        self.assertTrue(retained >= memory_tracker.phases['parse'][2])
+        self.assertTrue(memory_tracker.objects['Version'] >= 1000)
+
+        report = memory_tracker.report()
+        self.assertTrue(report[0].startswith('Peak traced memory'))
+        self.assertTrue(any(line.split()[-1:] == ['Version'] for line in report))
+
+    def test_limit(self):
+        memory_tracker.start(limit=1)
+        with self.assertRaises(MemoryLimitError):
+            with profiler.phase('load'):
+                [str(i) for i in range(100)]
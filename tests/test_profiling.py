@@ -0,0 +1,51 @@
+import io
+import os
+import pstats
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from pathlib import Path
+
+from verminator.profiling import profiler
+from verminator.releasemeta import ProductReleaseMeta
+from verminator.utils import *
+from verminator.verminator import VersionedInstance
+
+
+class ProfilingCase(unittest.TestCase):
+
+    def setUp(self):
+        this_file = Path(__file__)
+        self.tdc3ex_yml = this_file.parent.joinpath('releasesmeta/tdc3ex.yml')
+        self.versioned_instance_yml = this_file.parent.joinpath('releasesmeta/versioned_instance.yml')
+        profiler.reset()
+
+    def tearDown(self):
+        profiler.reset()
+
+    def test_phases(self):
+        meta = ProductReleaseMeta(self.tdc3ex_yml)
+        versioned_instance = VersionedInstance(**yaml_load(open(self.versioned_instance_yml)))
+        with redirect_stdout(io.StringIO()):
+            versioned_instance.validate_versioned_instance(meta)
+        self.assertTrue(profiler.timings == [])
+
+        profiler.enable(with_stats=True)
+        with redirect_stdout(io.StringIO()):
+            versioned_instance.validate_versioned_instance(meta)
+        profiler.disable()
+        phases = [t.phase for t in profiler.timings]
+        self.assertTrue(phases[-1] == 'validate')
+        self.assertTrue('remove-deprecated-releases' in phases and 'validate-releases' in phases)
+        self.assertTrue(all(t.instance == 'tdh-metrics-exporter' and t.major_version == '5.2'
+                            for t in profiler.timings))
+
+        report = profiler.report(top=1)
+        self.assertTrue(report[0].split() == ['phase', 'calls', 'total', 's', 'max', 's'])
+        self.assertTrue(report[-1].split()[:2] == ['tdh-metrics-exporter', '5.2'])
+
+        with tempfile.TemporaryDirectory() as root:
+            stats_file = os.path.join(root, 'run.pstats')
+            profiler.dump_stats(stats_file)
+            functions = [func for _, _, func in pstats.Stats(stats_file).stats]
+            self.assertTrue('_validate_releases' in functions)
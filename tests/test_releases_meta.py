@@ -125,3 +125,48 @@ class ProductReleaseMetaCase(unittest.TestCase):
         self.assert_vrange_equal(pv.get('sophonweb')[0], ('sophonweb-2.2.1-final', 'sophonweb-2.2.1-final'))
         self.assert_vrange_equal(pv.get('tos')[0], ('tos-1.9.2-final', 'tos-1.9.2-final'))
         self.assert_vrange_equal(pv.get('tdc')[0], ('tdc-2.0.0-rc3', 'tdc-2.0.0-rc3'))
+
+    def test_compatible_versions_cache(self):
+        meta = ProductReleaseMeta(self.tdc2ex_yml, cache_size=2)
+        pv = meta.get_compatible_versions('tdc-2.0.0-rc1')
+        self.assertTrue(meta.get_compatible_versions(parse_version('tdc-2.0.0-rc1')) is pv)
+        self.assertEqual(meta.cache_info().hits, 1)
+        self.assertEqual(meta.cache_info().misses, 1)
+        with self.assertRaises(TypeError):
+            pv['tdc'] = list()
+
+        meta.get_compatible_versions('tdc-2.0.0-rc1', self_appended=False)
+        meta.get_compatible_versions('tdc-2.0.0-rc3')
+        self.assertEqual(meta.cache_info().currsize, 2)
+        self.assertFalse(meta.get_compatible_versions('tdc-2.0.0-rc1') is pv)
+
+    def test_instance_release_table(self):
+        meta = ProductReleaseMeta(self.tdc3ex_yml)
+        table = meta._get_release_table('workflow')
+        self.assertTrue(meta._get_release_table('workflow') is table)
+        default = meta.get_releases()
+        tdc_release = parse_version('tdc-2.0.0-rc0')
+        sophon_release = parse_version('sophonweb-2.2.1-final')
+        self.assertTrue(table.releases[tdc_release] is default[tdc_release])
+        self.assertFalse(table.releases[sophon_release] is default[sophon_release])
+        self.assert_vrange_equal(table.releases[sophon_release]['transwarp'],
+                                 ('transwarp-5.2.4-final', 'transwarp-5.2.4-final'))
+        self.assert_vrange_equal(default[sophon_release]['transwarp'],
+                                 ('transwarp-5.2.1-final', 'transwarp-5.2.4-final'))
+
+    def test_tdc_timeline(self):
+        meta = ProductReleaseMeta(self.tdc_yml)
+        timeline = meta._get_tdc_timeline()
+        self.assertTrue(meta._get_tdc_timeline() is timeline)
+        self.assert_vrange_equal(timeline.global_range, ('tdc-1.0.0-rc1', 'tdc-1.2.1-rc1'))
+        self.assertEqual(str(timeline.first_of(parse_version('tdc-1.1'))), 'tdc-1.1.0-rc0')
+        self.assertEqual(str(timeline.last_of(parse_version('tdc-1.1'))), 'tdc-1.1.1-final')
+        self.assertTrue(timeline.first_of(parse_version('tdc-1.9')) is None)
+
+    def test_pickle(self):
+        import pickle
+        meta = ProductReleaseMeta(self.tdc2ex_yml)
+        pv = meta.get_compatible_versions('tdc-2.0.0-rc1')
+        cloned = pickle.loads(pickle.dumps(meta))
+        self.assertEqual(dict(cloned.get_compatible_versions('tdc-2.0.0-rc1')), dict(pv))
+        self.assertEqual(cloned.get_tdc_version_range(), meta.get_tdc_version_range())
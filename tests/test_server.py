@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from verminator.releasemeta import ProductReleaseMeta
+from verminator.server import QueryService, _handle_lines, query_versions
+from verminator.utils import *
+
+
+class QueryServiceCase(unittest.TestCase):
+
+    def setUp(self):
+        this_file = Path(__file__)
+        self.tdc3ex_yml = this_file.parent.joinpath('releasesmeta/tdc3ex.yml')
+        self.versioned_instance_yml = this_file.parent.joinpath('releasesmeta/versioned_instance.yml')
+        self.root = tempfile.mkdtemp()
+        self.meta_file = Path(self.root).joinpath('releases_meta.yaml')
+        shutil.copy(str(self.tdc3ex_yml), str(self.meta_file))
+        version_folder = Path(self.root).joinpath('tdh-metrics-exporter', '5.2')
+        version_folder.mkdir(parents=True)
+        shutil.copy(str(self.versioned_instance_yml), str(version_folder.joinpath('images.yaml')))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_queries(self):
+        service = QueryService(self.meta_file, self.root)
+        meta = ProductReleaseMeta(self.tdc3ex_yml)
+
+        res = service.handle({'op': 'compatible', 'version': 'transwarp-5.2.2-final'})
+        expected = meta.get_compatible_versions('transwarp-5.2.2-final')
+        self.assertTrue(res['result'] == dict(
+            (p, [[str(v1), str(v2)] for v1, v2 in vranges]) for p, vranges in expected.items()))
+
+        res = service.handle({'op': 'tdc-range', 'version': 'transwarp-5.2.2-final'})
+        self.assertTrue(res['result'] == [str(v) for v in meta.get_tdc_version_range('transwarp-5.2.2-final')])
+
+        res = service.handle({'op': 'release', 'version': '5.2.2', 'instance': 'tdh-metrics-exporter'})
+        self.assertTrue(len(res['result']) == 1)
+        self.assertTrue(res['result'][0]['major-version'] == '5.2')
+        self.assertTrue(res['result'][0]['release']['release-version'] == '5.2.2')
+
+        self.assertTrue('error' in service.handle({'op': 'compatible'}))
+        self.assertTrue('error' in service.handle({'op': 'unknown'}))
+        self.assertTrue('error' in QueryService(self.meta_file).handle({'op': 'release', 'version': '5.2.2'}))
+
+    def test_query_versions(self):
+        service = QueryService(self.meta_file)
+        lines = ['transwarp-5.2.2-final\n', '\n', 'transwarp-5.2.2-final\n', 'bad..\n']
+        results = list(query_versions(service, lines, 'tdh-metrics-exporter'))
+        self.assertTrue(len(results) == 3)
+        # Repeated versions are answered once
+        self.assertTrue(results[0] is results[1])
+        self.assertTrue(results[0]['compatible'] == service.compatible('transwarp-5.2.2-final', 'tdh-metrics-exporter'))
+        self.assertTrue(results[0]['tdc_range'] == service.tdc_range('transwarp-5.2.2-final', 'tdh-metrics-exporter'))
+        self.assertTrue(results[2]['version'] == 'bad..' and 'error' in results[2])
+
+    def test_failures(self):
+        # Releases of an OEM only, without any TDC releases
+        meta_file = Path(self.root).joinpath('oem_meta.yaml')
+        ordered_yaml_dump({'Releases': [{
+            'release_name': 'gzes-1.0.0-final',
+            'products': [{'min': 'transwarp-5.2.1-final', 'max': 'transwarp-5.2.1-final'}],
+        }]}, open(str(meta_file), 'w'), default_flow_style=False)
+        service = QueryService(meta_file)
+        self.assertTrue('IndexError' in service.handle({'op': 'tdc-range'})['error'])
+        res = service.handle({'op': 'tdc-range', 'version': 'transwarp-5.2.1-final', 'instance': ['hdfs']})
+        self.assertTrue('TypeError' in res['error'])
+        results = list(query_versions(service, ['transwarp-5.2.1-final'], ['hdfs']))
+        self.assertTrue('error' in results[0])
+
+    def test_reload(self):
+        service = QueryService(self.meta_file, self.root)
+        self.assertTrue(not service.reload_if_changed())
+        image_file = Path(self.root).joinpath('tdh-metrics-exporter', '5.2', 'images.yaml')
+        image_file.unlink()
+        self.assertTrue(service.reload_if_changed())
+        self.assertTrue(service.handle({'op': 'release', 'version': '5.2.2'})['result'] == [])
+        self.assertTrue(service.handle({'op': 'status'})['result']['reloads'] == 1)
+
+        # Stamps scanned already, e.g., out of the event loop
+        stamps = service._stamps()
+        self.assertTrue(not service.reload_if_changed(stamps))
+        self.meta_file.touch()
+        os.utime(str(self.meta_file), ns=(0, 0))
+        self.assertTrue(not service.reload_if_changed(stamps))
+        self.assertTrue(service.reload_if_changed(service._stamps()))
+
+    def test_json_lines(self):
+        service = QueryService(self.meta_file)
+        path = os.path.join(self.root, 'verminator.sock')
+        loop = asyncio.new_event_loop()
+
+        async def query():
+            server = await asyncio.start_unix_server(lambda r, w: _handle_lines(service, r, w), path)
+            reader, writer = await asyncio.open_unix_connection(path)
+            writer.write(b'{"op": "tdc-range"}\nnot json\n')
+            writer.write_eof()
+            responses = [json.loads((await reader.readline()).decode('utf-8')) for _ in range(2)]
+            # Closed by the server at the end
+            self.assertTrue(await reader.read() == b'')
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return responses
+
+        try:
+            responses = loop.run_until_complete(query())
+        finally:
+            loop.close()
+        self.assertTrue(responses[0] == service.handle({'op': 'tdc-range'}))
+        self.assertTrue('error' in responses[1])
@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 
 from verminator.utils import *
@@ -74,4 +76,164 @@ class UtilsCase(unittest.TestCase):
         ])
         self.assertTrue(len(cvr) == 2)
         self.assert_vrange_equal(cvr[0], (parse_version('tdc-1.0.0-rc0'), parse_version('tdc-1.2.0-final')))
-        self.assert_vrange_equal(cvr[1], (parse_version('transwarp-1.1.0-rc0'), parse_version('transwarp-1.1.0-final')))
\ No newline at end of file
+        self.assert_vrange_equal(cvr[1], (parse_version('transwarp-1.1.0-rc0'), parse_version('transwarp-1.1.0-final')))
+
+    def test_interned_version(self):
+        v = parse_version('tdc-1.2.1-final')
+        self.assertTrue(v is parse_version('tdc-1.2.1-final'))
+        self.assertTrue(v is parse_version(v))
+        self.assertTrue(copy.deepcopy(v) is v)
+        self.assertTrue(to_major_version(v) is parse_version('tdc-1.2'))
+        self.assertTrue(parse_version(v, True) is to_major_version('tdc-1.2.1-rc0'))
+        self.assertTrue(replace_product_name(v, 'gzes') is parse_version('gzes-1.2.1-final'))
+        self.assertTrue(str(v.add(VersionDelta(maintenance=1))) == 'tdc-1.2.2-final')
+        with self.assertRaises(AttributeError):
+            v.prefix = 'gzes'
+        self.assertTrue(str(v) == 'tdc-1.2.1-final')
+
+    def test_pickle_version(self):
+        import pickle
+        v = parse_version('transwarp-6.0.1-rc2')
+        self.assertTrue(pickle.loads(pickle.dumps(v)) is v)
+
+    def test_version_sort_key(self):
+        corpus = ['tdc-1.0.0-rc0', 'tdc-1.0.0-rc2', 'tdc-1.0.0-rc10', 'tdc-1.0.0-final',
+                  'tdc-1.0.1-rc0', 'tdc-1.1.0-final', 'tdc-1.0', 'tdc-1.1', 'tdc-2.0',
+                  'gzes-1.0.0-final', 'tos-1.8.0.1', 'tos-1.8.0.2', 'tos-1.8.0-rc2',
+                  '5.2.2', '5.2.3', '5.2', '6.0', 'transwarp-5.2.1-final']
+        versions = [parse_version(v) for v in corpus]
+        for v1 in versions:
+            for v2 in versions:
+                cmp = FlexVersion.compares(VersionMeta(str(v1)), VersionMeta(str(v2)))
+                if v1._depth == v2._depth:
+                    k1, k2 = version_key(v1), version_key(v2)
+                    self.assertEqual(cmp, (k1 > k2) - (k1 < k2), (v1, v2))
+                self.assertEqual(cmp, v1.compares(v2), (v1, v2))
+
+        ordered = sorted(['tdc-1.1', 'tdc-1.0.0-final', 'tdc-1.0', 'tdc-1.0.0-rc2', 'tdc-1.0.0-rc10'],
+                         key=version_key)
+        self.assertEqual(ordered, ['tdc-1.0.0-rc2', 'tdc-1.0.0-rc10', 'tdc-1.0.0-final', 'tdc-1.0', 'tdc-1.1'])
+
+        v = parse_version('5.2')
+        self.assertTrue(v.in_range(parse_version('5.2.2'), parse_version('5.2.2')))
+        self.assertTrue(parse_version('tdc-1.0.0-rc2').in_range(versions[0], versions[3]))
+        self.assertFalse(parse_version('tdc-1.0.1-rc0').in_range(versions[0], versions[3]))
+
+    def test_version_range_set(self):
+        import random
+        rnd = random.Random(7)
+        versions = ['tdc-1.0', 'tdc-1.1', '5.2', '5.2.2', '5.2.3', 'tos-1.8.0.1', 'tos-1.8.0-rc2']
+        for maj in range(1, 3):
+            for mnt in range(3):
+                versions += ['tdc-%d.%d.%d-rc%d' % (maj, mnt % 2, mnt, i) for i in range(3)]
+                versions.append('tdc-%d.%d.%d-final' % (maj, mnt % 2, mnt))
+        versions = [parse_version(v) for v in versions]
+
+        for _ in range(50):
+            vranges = list()
+            for _ in range(rnd.randint(0, 8)):
+                v1, v2 = rnd.choice(versions), rnd.choice(versions)
+                if v1.prefix == v2.prefix and v1._depth == v2._depth and v1 > v2:
+                    v1, v2 = v2, v1
+                if v1.prefix != v2.prefix or v1.compares(v2) <= 0:
+                    vranges.append((v1, v2))
+            vrange_set = VersionRangeSet(vranges)
+            for v in versions:
+                self.assertEqual(v in vrange_set, check_version_in_vranges_list(v, vranges), (v, vranges))
+
+        vrs = VersionRangeSet([(parse_version('tdc-1.0.0-rc0'), parse_version('tdc-1.0.0-final'))])
+        union = vrs.union([(parse_version('tdc-1.1.0-rc0'), parse_version('tdc-1.1.0-final'))])
+        self.assertEqual(len(union), 1)
+        self.assertTrue('tdc-1.0.1-final' in union)
+        inter = union.intersection([(parse_version('tdc-1.0.0-final'), parse_version('tdc-1.2.0-final')),
+                                    (parse_version('tos-1.0.0-final'), parse_version('tos-1.2.0-final'))])
+        self.assert_vrange_equal(inter.vranges[0], ('tdc-1.0.0-final', 'tdc-1.1.0-final'))
+        self.assertEqual(len(inter), 1)
+
+        # An inverted range fails checks of versions of its product only
+        vrs = VersionRangeSet([(parse_version('tos-1.2.0-final'), parse_version('tos-1.0.0-final')),
+                               (parse_version('tdc-1.0.0-rc0'), parse_version('tdc-1.0.0-final'))])
+        self.assertTrue('tdc-1.0.0-rc1' in vrs)
+        self.assertTrue('transwarp-1.0.0-final' not in vrs)
+        with self.assertRaises(ValueError):
+            'tos-1.1.0-final' in vrs
+
+    def test_sorted_versions(self):
+        ordered = sorted_versions(['tdc-1.1', 'tdc-1.0.0-final', 'tdc-1.0', 'tdc-1.0.0-rc2'])
+        self.assertEqual(ordered, ['tdc-1.0.0-rc2', 'tdc-1.0.0-final', 'tdc-1.0', 'tdc-1.1'])
+        # Equal versions by wildcards keep their order
+        self.assertEqual([str(v) for v in sorted_versions([parse_version('5.2.2'), parse_version('5.2')])],
+                         ['5.2.2', '5.2'])
+        self.assertEqual([str(v) for v in sorted_versions([parse_version('5.2'), parse_version('5.2.2')])],
+                         ['5.2', '5.2.2'])
+        self.assertEqual(sorted_versions([('tdc-1.1', 1), ('tdc-1.0', 2)], key=lambda x: parse_version(x[0])),
+                         [('tdc-1.0', 2), ('tdc-1.1', 1)])
+
+    def test_version_interval_index(self):
+        import random
+        rnd = random.Random(11)
+        versions = ['tdc-1.0', 'tdc-1.1', '5.2', '5.2.2', '5.2.3', 'tos-1.8.0.1', 'tos-1.8.0-rc2']
+        for mnt in range(4):
+            versions += ['tdc-1.%d.%d-rc%d' % (mnt % 2, mnt, i) for i in range(3)]
+            versions.append('tdc-1.%d.%d-final' % (mnt % 2, mnt))
+        versions = [parse_version(v) for v in versions]
+
+        for _ in range(50):
+            entries = list()
+            for i in range(rnd.randint(0, 10)):
+                v1, v2 = rnd.choice(versions), rnd.choice(versions)
+                if v1.prefix == v2.prefix and v1._depth == v2._depth and v1 > v2:
+                    v1, v2 = v2, v1
+                if v1.prefix != v2.prefix or v1.compares(v2) <= 0:
+                    entries.append((v1, v2, i))
+            index = VersionIntervalIndex(entries)
+            for v in versions:
+                expected = [i for minv, maxv, i in entries if v.in_range(minv, maxv)]
+                self.assertEqual(index.find(v), expected, (v, entries))
+
+    def test_version_index(self):
+        import random
+        rnd = random.Random(13)
+        versions = ['tdc-1.0', 'tdc-1.1', '5.2', '5.2.2', '5.2.3', 'tos-1.8.0.1', 'tos-1.8.0-rc2', 'tos-1.8.0-rc']
+        for mnt in range(4):
+            versions += ['tdc-1.%d.%d-rc%d' % (mnt % 2, mnt, i) for i in range(3)]
+            versions.append('tdc-1.%d.%d-final' % (mnt % 2, mnt))
+        versions = [parse_version(v) for v in versions]
+
+        for _ in range(50):
+            indexed = rnd.sample(versions, rnd.randint(0, len(versions)))
+            index = VersionIndex(indexed)
+            self.assertTrue(len(index) == len(indexed))
+            for _ in range(20):
+                v1, v2 = rnd.choice(versions), rnd.choice(versions)
+                if v1.prefix != v2.prefix or v1.compares(v2) > 0:
+                    continue
+                expected = any(v.in_range(v1, v2) for v in indexed)
+                self.assertEqual(index.any_in_range(v1, v2), expected, (v1, v2, indexed))
+
+    def test_ordered_yaml(self):
+        data = OrderedDict()
+        data['instance-type'] = 'zookeeper'
+        data['major-version'] = '5.2'
+        data['images'] = [{'name': 'zookeeper', 'version': '5.2.2'}]
+        data['releases'] = [OrderedDict([('release-version', '5.2.2'), ('final', True)])]
+
+        dumped = ordered_yaml_dump(data, default_flow_style=False)
+        self.assertTrue(dumped.startswith('instance-type: zookeeper\nmajor-version: \'5.2\'\n'))
+        # The same outputs of the C and the pure Python dumpers
+        self.assertTrue(dumped == ordered_yaml_dump(data, Dumper=yaml.SafeDumper, default_flow_style=False))
+        self.assertTrue(yaml_load(dumped) == data)
+        self.assertTrue(yaml_load(dumped, Loader=yaml.SafeLoader) == data)
+
+    def test_write_if_changed(self):
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, 'images.yaml')
+            self.assertTrue(write_if_changed(path, 'a: 1\n'))
+            os.chmod(path, 0o640)
+            os.utime(path, (0, 0))
+            self.assertFalse(write_if_changed(path, 'a: 1\n'))
+            self.assertTrue(os.stat(path).st_mtime == 0)
+            self.assertTrue(write_if_changed(path, 'a: 2\n'))
+            self.assertTrue(open(path).read() == 'a: 2\n')
+            self.assertTrue(os.stat(path).st_mode & 0o777 == 0o640)
+            self.assertTrue(os.listdir(root) == ['images.yaml'])
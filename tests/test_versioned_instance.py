@@ -1,9 +1,15 @@
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 from pathlib import Path
 
 from verminator.releasemeta import ProductReleaseMeta
 from verminator.utils import *
-from verminator.verminator import VersionedInstance
+from verminator.verminator import InstanceTree, VersionedInstance
 
 
 class VersionedInstanceCase(unittest.TestCase):
@@ -15,7 +21,7 @@ class VersionedInstanceCase(unittest.TestCase):
 
     def test_official(self):
         meta = ProductReleaseMeta(self.tdc3ex_yml)
-        versioned_instance = VersionedInstance(**yaml.load(open(self.versioned_instance_yml)))
+        versioned_instance = VersionedInstance(**yaml_load(open(self.versioned_instance_yml)))
         self.assertTrue(str(versioned_instance.min_tdc_version) == 'tdc-2.0.0-rc0')
         self.assertTrue(str(versioned_instance.max_tdc_version) == 'tdc-2.0.0-rc9')
         versioned_instance._validate_releases(meta)
@@ -24,3 +30,113 @@ class VersionedInstanceCase(unittest.TestCase):
         for dep in release.dependencies:
             self.assertTrue(str(release.dependencies[dep][0]) == 'transwarp-5.2.2-final')
             self.assertTrue(str(release.dependencies[dep][1]) == 'transwarp-5.2.2-final')
+
+    def test_instance_tree(self):
+        meta = ProductReleaseMeta(self.tdc3ex_yml)
+        with tempfile.TemporaryDirectory() as root:
+            version_folder = Path(root).joinpath('tdh-metrics-exporter', '5.2')
+            version_folder.mkdir(parents=True)
+            shutil.copy(str(self.versioned_instance_yml), str(version_folder.joinpath('images.yaml')))
+
+            tree = InstanceTree(root)
+            instance = tree.load_instance('tdh-metrics-exporter')
+            self.assertTrue(list(instance.versioned_instances) == ['5.2'])
+            instance.validate_instance(meta)
+            instance.dump()
+            tree.update(instance)
+
+            # The updated tree is the same as reloaded from dumped files
+            images = list(tree.iter_images())
+            reloaded = list(InstanceTree(root).iter_images())
+            self.assertTrue(len(images) == 1)
+            self.assertTrue(images[0][:2] == ('tdh-metrics-exporter', '5.2'))
+            self.assertTrue(images == reloaded)
+
+    def test_dump_diff(self):
+        meta = ProductReleaseMeta(self.tdc3ex_yml)
+        with tempfile.TemporaryDirectory() as root:
+            version_folder = Path(root).joinpath('tdh-metrics-exporter', '5.2')
+            version_folder.mkdir(parents=True)
+            image_file = version_folder.joinpath('images.yaml')
+            shutil.copy(str(self.versioned_instance_yml), str(image_file))
+            origin = open(str(image_file)).read()
+
+            instance = InstanceTree(root).load_instance('tdh-metrics-exporter')
+            instance.validate_instance(meta)
+            diff = io.StringIO()
+            self.assertTrue(instance.dump(diff=diff) == 1)
+            self.assertTrue(open(str(image_file)).read() == origin)
+            self.assertTrue(diff.getvalue().startswith(
+                '--- a/tdh-metrics-exporter/5.2/images.yaml\n+++ b/tdh-metrics-exporter/5.2/images.yaml\n'))
+
+            # No diffs once dumped
+            self.assertTrue(instance.dump() == 1)
+            diff = io.StringIO()
+            self.assertTrue(instance.dump(diff=diff) == 0)
+            self.assertTrue(diff.getvalue() == '')
+
+    def test_compact_models(self):
+        dat = yaml_load(open(self.versioned_instance_yml))
+        versioned_instance = VersionedInstance(**dat)
+        self.assertTrue(not hasattr(versioned_instance, '__dict__'))
+
+        # Images are tuples read as dicts
+        for var, image in versioned_instance.images:
+            self.assertTrue(image['variable'] == image.variable == var)
+            self.assertTrue(image.get('roles') is None and image.get('unknown', 1) == 1)
+        self.assertTrue(versioned_instance.to_dict()['images'] == [
+            {key: value for key, value in i.items() if value is not None} for i in dat['images']])
+
+        # Releases of the same dependency ranges share them
+        other = VersionedInstance(**dat)
+        for r in versioned_instance.releases:
+            o = other.get_release(r.release_version)
+            self.assertTrue(not hasattr(r, '__dict__'))
+            for dep, vrange in r.dependencies.items():
+                self.assertTrue(o.dependencies[dep] is vrange)
+
+    def test_validate_diff(self):
+        # Releases beyond the hot-fix range, fixed by validation, in files only if dumped
+        transwarp = ['transwarp-5.2.1-final', 'transwarp-5.2.2-final', 'transwarp-5.2.3-final']
+        root_dir = Path(__file__).parent.parent
+        with tempfile.TemporaryDirectory() as root:
+            shutil.copy(str(self.tdc3ex_yml), os.path.join(root, 'releases_meta.yaml'))
+            for instance, deps in (('zookeeper', []), ('hdfs', ['zookeeper'])):
+                releases = [{
+                    'release-version': v,
+                    'image-version': {instance + '_image': v},
+                    'dependencies': [{'type': d, 'min-version': transwarp[0], 'max-version': transwarp[-1]}
+                                     for d in deps],
+                    'final': True,
+                } for v in transwarp]
+                version_folder = Path(root).joinpath(instance, '5.2')
+                version_folder.mkdir(parents=True)
+                ordered_yaml_dump({
+                    'instance-type': instance, 'major-version': '5.2',
+                    'min-tdc-version': 'tdc-2.0.0-rc0', 'max-tdc-version': 'tdc-2.0.0-rc3',
+                    'hot-fix-ranges': [{'min': transwarp[0], 'max': transwarp[0]}],
+                    'images': [{'name': instance, 'variable': instance + '_image'}],
+                    'releases': releases,
+                }, open(str(version_folder.joinpath('images.yaml')), 'w'), default_flow_style=False)
+            origin = open(os.path.join(root, 'hdfs', '5.2', 'images.yaml')).read()
+
+            env = dict(os.environ, PYTHONPATH=str(root_dir))
+            for options in ([], ['-j', '2'], ['-m', os.path.join(root, 'manifest.json')]):
+                patch = os.path.join(root, 'fixes.patch')
+                proc = subprocess.run(
+                    [sys.executable, str(root_dir.joinpath('bin', 'verminator')), 'validate', '--diff', patch]
+                    + options + [root], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+                self.assertTrue(proc.returncode == 0, proc.stdout.decode('utf-8'))
+                self.assertTrue('+- max: transwarp-5.2.3-final' in open(patch).read())
+                self.assertTrue(open(os.path.join(root, 'hdfs', '5.2', 'images.yaml')).read() == origin)
+
+            # Stdout is a clean patch, with progress and the summary in stderr
+            for options in ([], ['-j', '2'], ['-m', os.path.join(root, 'manifest.json')]):
+                proc = subprocess.run(
+                    [sys.executable, str(root_dir.joinpath('bin', 'verminator')), 'validate', '--diff', '-']
+                    + options + [root], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+                self.assertTrue(proc.returncode == 0, proc.stderr.decode('utf-8'))
+                patch = proc.stdout.decode('utf-8')
+                self.assertTrue(patch.startswith('--- a/'))
+                self.assertTrue(all(line[:1] in ('-', '+', ' ', '@') for line in patch.splitlines()), patch)
+                self.assertTrue('images.yaml file(s) to change' in proc.stderr.decode('utf-8'))
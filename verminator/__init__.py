@@ -1,4 +1,5 @@
 # Version terminator to handle with instance images version operations.
+__version__ = '1.3.5'
 
 from .config import *
 from .releasemeta import *
@@ -0,0 +1,167 @@
+# Batch membership of versions in version ranges, answered as `Version.in_range`
+# does pair by pair. With NumPy installed, versions are encoded as integer rows
+# of their sort keys (major, minor, maintenance, build, suffix rank, suffix version)
+# and whole batches are compared at once; otherwise pairs are checked one by one.
+# NumPy is imported by the first batch vectorized only, not by importing verminator.
+from importlib.util import find_spec
+
+from .utils import *
+
+__all__ = ['HAS_NUMPY', 'in_ranges_matrix', 'in_range_pairs', 'any_in_ranges']
+
+HAS_NUMPY = find_spec('numpy') is not None
+numpy = None
+
+# Pairs of a batch below which NumPy costs more than checking one by one
+VECTORIZED_MIN_PAIRS = 256
+
+
+def _vectorized(pairs, vectorized):
+    global numpy
+    if vectorized is None:
+        vectorized = HAS_NUMPY and pairs >= VECTORIZED_MIN_PAIRS
+    elif vectorized and not HAS_NUMPY:
+        raise ImportError('NumPy is required for vectorized version checks')
+    if vectorized and numpy is None:
+        import numpy
+    return vectorized
+
+
+class _Encoder(object):
+    """
+    Encode versions as (prefix ids, form ids, rows of sort keys).
+
+    Versions of the same form, i.e., (depth, suffix, if suffix version absent),
+    compare by sort keys as `_key_comparable` tells, and versions without
+    sort keys take the last form id comparable with none.
+    """
+
+    def __init__(self):
+        self.prefixes = dict()  # {prefix: id}
+        self.forms = dict()  # {form: id}
+        self._encoded = list()
+
+    def add(self, versions):
+        prefixes, forms, rows = list(), list(), list()
+        for v in versions:
+            prefixes.append(self.prefixes.setdefault(v.prefix, len(self.prefixes)))
+            key = v._sort_key if isinstance(v, Version) else None
+            if key is None:
+                forms.append(None)
+                rows.append((0,) * 6)
+            else:
+                forms.append(self.forms.setdefault((v._depth, v.suffix, v.suffix_version is None), len(self.forms)))
+                rows.append(key[1:])
+        self._encoded.append((prefixes, forms, rows))
+        return len(self._encoded) - 1
+
+    def arrays(self, i, shape):
+        """Arrays of the i-th versions added, with the leading shape to broadcast"""
+        prefixes, forms, rows = self._encoded[i]
+        unkeyed = len(self.forms)
+        forms = [unkeyed if f is None else f for f in forms]
+        return (numpy.array(prefixes, dtype=numpy.int64).reshape(shape),
+                numpy.array(forms, dtype=numpy.int64).reshape(shape),
+                numpy.array(rows, dtype=numpy.int64).reshape(shape + (6,)))
+
+    def comparable_forms(self):
+        """A table of forms comparable by sort keys, see `_key_comparable`"""
+        table = numpy.zeros((len(self.forms) + 1,) * 2, dtype=bool)
+        for (d1, s1, n1), i in self.forms.items():
+            for (d2, s2, n2), j in self.forms.items():
+                table[i, j] = d1 == d2 and (s1 != s2 or n1 == n2)
+        return table
+
+
+def _lex_le(a, b):
+    """Compare rows of a and b lexicographically, a <= b"""
+    le = a[..., -1] <= b[..., -1]
+    for c in range(a.shape[-1] - 2, -1, -1):
+        le = (a[..., c] < b[..., c]) | ((a[..., c] == b[..., c]) & le)
+    return le
+
+
+def _numpy_in_range(versions, vranges, matrix):
+    """
+    Check versions in vranges as a matrix (versions x vranges) or pair by pair.
+
+    :return: the bool array, or None if numbers of versions overflow int64.
+    """
+    encoder = _Encoder()
+    iv = encoder.add(versions)
+    imin = encoder.add([vrange[0] for vrange in vranges])
+    imax = encoder.add([vrange[1] for vrange in vranges])
+    vshape, rshape = ((len(versions), 1), (1, len(vranges))) if matrix else ((len(versions),),) * 2
+    try:
+        pv, fv, rv = encoder.arrays(iv, vshape)
+        pmin, fmin, rmin = encoder.arrays(imin, rshape)
+        pmax, fmax, rmax = encoder.arrays(imax, rshape)
+    except OverflowError:
+        return None
+
+    table = encoder.comparable_forms()
+    same_prefix = (pv == pmin) & (pv == pmax)
+    comparable = same_prefix & table[fv, fmin] & table[fv, fmax] & table[fmin, fmax]
+    invalid = comparable & ~_lex_le(rmin, rmax)
+    if invalid.any():
+        j = numpy.argwhere(invalid)[0][-1]
+        raise ValueError('The minv ({}) should be a lower/equal version against maxv ({}).'
+                         .format(vranges[j][0], vranges[j][1]))
+    res = comparable & _lex_le(rmin, rv) & _lex_le(rv, rmax)
+
+    # Versions of other forms, e.g., missing numbers as wildcards, are checked one by one
+    for index in numpy.argwhere(same_prefix & ~comparable):
+        v, vrange = versions[index[0]], vranges[index[-1]]
+        res[tuple(index)] = v.in_range(vrange[0], vrange[1])
+    return res
+
+
+def _parse_vranges(vranges):
+    return [(parse_version(minv), parse_version(maxv)) for minv, maxv in vranges]
+
+
+def in_ranges_matrix(versions, vranges, vectorized=None):
+    """
+    Check if each version falls into each version range.
+
+    :param vectorized: use NumPy or not, by the batch size if None.
+    :return: [[bool of each range] of each version]
+    """
+    versions = [parse_version(v) for v in versions]
+    vranges = _parse_vranges(vranges)
+    if _vectorized(len(versions) * len(vranges), vectorized):
+        res = _numpy_in_range(versions, vranges, True)
+        if res is not None:
+            return res.tolist()
+    return [[v.in_range(minv, maxv) for minv, maxv in vranges] for v in versions]
+
+
+def in_range_pairs(versions, vranges, vectorized=None):
+    """
+    Check if versions[i] falls into vranges[i] for each i.
+
+    :return: [bool of each pair]
+    """
+    assert len(versions) == len(vranges), 'Versions and ranges should be paired'
+    versions = [parse_version(v) for v in versions]
+    vranges = _parse_vranges(vranges)
+    if _vectorized(len(versions), vectorized):
+        res = _numpy_in_range(versions, vranges, False)
+        if res is not None:
+            return res.tolist()
+    return [v.in_range(minv, maxv) for v, (minv, maxv) in zip(versions, vranges)]
+
+
+def any_in_ranges(versions, vranges, vectorized=None):
+    """
+    Check if any of versions falls into each version range.
+
+    :return: [bool of each range]
+    """
+    versions = [parse_version(v) for v in versions]
+    vranges = _parse_vranges(vranges)
+    if _vectorized(len(versions) * len(vranges), vectorized):
+        res = _numpy_in_range(versions, vranges, True)
+        if res is not None:
+            return res.any(axis=0).tolist()
+    return [any(v.in_range(minv, maxv) for v in versions) for minv, maxv in vranges]
@@ -0,0 +1,110 @@
+# On-disk cache of loaded images.yaml data, which saves YAML parsing of
+# unchanged files across verminator runs. It holds the plain data, from which
+# versioned instances and versions are still built by every run.
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+import yaml
+
+from . import __version__
+from .utils import *
+
+__all__ = ['ParseCache']
+
+
+class ParseCache(object):
+    """
+    Cache of the data loaded from yaml files, stored as pickles in a folder.
+
+    An entry is keyed by the absolute path, mtime and size of a file, thus a
+    modified file is parsed again. Entries created by other cache schemas,
+    verminator versions or YAML loaders never hit and are evicted when the total size of the folder
+    is beyond `max_size` bytes, the least recently used first.
+    """
+
+    # Bump when the form of cached data changes
+    CACHE_SCHEMA = 1
+
+    # Max total size of cache files in bytes
+    DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+    SUFFIX = '.pickle'
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = Path(cache_dir)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, yaml_file):
+        st = os.stat(str(yaml_file))
+        key = '{}|{}|{}|{}|{}|{}|{}'.format(
+            self.CACHE_SCHEMA, __version__, yaml.__version__, YamlLoader.__name__,
+            os.path.abspath(str(yaml_file)), st.st_mtime_ns, st.st_size)
+        return self.cache_dir.joinpath(hashlib.sha1(key.encode('utf-8')).hexdigest() + self.SUFFIX)
+
+    def load(self, yaml_file):
+        """Load data of a yaml file, from the cache if it's unchanged"""
+        entry = self._entry_path(yaml_file)
+        try:
+            with open(str(entry), 'rb') as ifile:
+                data = pickle.load(ifile)
+            # Mark as recently used
+            os.utime(str(entry))
+            self.hits += 1
+            return data
+        except FileNotFoundError:
+            pass
+        except Exception:
+            # A broken entry, e.g., truncated or pickled by other code, loaded again
+            try:
+                entry.unlink()
+            except OSError:
+                pass
+        self.misses += 1
+        with open(str(yaml_file)) as ifile:
+            data = yaml_load(ifile)
+        self.put(yaml_file, data)
+        return data
+
+    def put(self, yaml_file, data):
+        """Store data as the current content of a yaml file"""
+        entry = self._entry_path(yaml_file)
+        fd, tmp = tempfile.mkstemp(dir=str(self.cache_dir), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as of:
+                pickle.dump(data, of, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, str(entry))
+        except OSError:
+            # Caching is best effort
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def prune(self):
+        """Evict least recently used entries until the total size is under the limit"""
+        entries = list()
+        total = 0
+        for entry in self.cache_dir.iterdir():
+            if entry.suffix != self.SUFFIX:
+                continue
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry))
+            total += st.st_size
+        entries.sort(key=lambda x: x[0])
+        for _, size, entry in entries:
+            if total <= self.max_size:
+                break
+            try:
+                entry.unlink()
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        for entry in self.cache_dir.iterdir():
+            if entry.suffix == self.SUFFIX:
+                entry.unlink()
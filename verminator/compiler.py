@@ -0,0 +1,304 @@
+# Compile the release meta into a compatibility matrix, i.e., compatible versions
+# of every declared version evaluated once, for consumers to look up instead of
+# merging declared and derived constraints themselves.
+#
+# The matrix is a table of declared versions (release names and bounds of product
+# ranges) sorted by versions, and columns of compatible ranges of each product:
+#
+# {
+#   "schema": 1, "meta_digest": sha1 of releases_meta.yaml, "oem": "tdc",
+#   "versions": [version strings referred by indexes],
+#   "releases": [indexes of declared versions, sorted],
+#   "products": [product names],
+#   "overlays": [
+#     {"instance": null, "rows": [indexes of releases],
+#      "columns": {product: [[[min index, max index], ...] or null of each row]}},
+#     {"instance": "terminal", ...only rows differing from the general overlay}
+#   ]
+# }
+#
+# Stored as json, or a binary form of the same content (see `_write_binary`).
+import hashlib
+import json
+import multiprocessing
+import os
+import struct
+import tempfile
+
+from .config import verminator_config as VC
+from .utils import *
+
+__all__ = ['compile_matrix', 'write_matrix', 'load_matrix', 'matrix_stamp', 'meta_digest', 'CompatibilityMatrix']
+
+SCHEMA = 1
+MAGIC = b'VMTX'
+
+# The release meta of worker process
+_release_meta = None
+
+
+def meta_digest(meta_file):
+    with open(str(meta_file), 'rb') as ifile:
+        return hashlib.sha1(ifile.read()).hexdigest()
+
+
+def _declared_versions(meta):
+    """Release names and bounds of product ranges in the meta, [Version] sorted"""
+    versions = set()
+    for instance in [meta.DEFAULT_INSTANCE_NAME] + meta.get_instance_names():
+        for release_ver, products in meta.get_releases(instance).items():
+            versions.add(release_ver)
+            for minv, maxv in products.values():
+                versions.update((minv, maxv))
+    return sorted_versions(versions)
+
+
+def _evaluate(meta, instance, versions):
+    """Compatible versions of versions with constraints of the instance, [{product: [(minv, maxv)]}]"""
+    res = list()
+    for v in versions:
+        cv = meta.get_compatible_versions(v, instance_name=instance)
+        res.append(dict((p, [(str(v1), str(v2)) for v1, v2 in vranges]) for p, vranges in cv.items()))
+    return res
+
+
+def _init_worker(release_meta, oem_name):
+    global _release_meta
+    _release_meta = release_meta
+    VC.set_oem(oem_name)
+
+
+def _evaluate_task(task):
+    instance, versions = task
+    return _evaluate(_release_meta, instance, versions)
+
+
+def compile_matrix(meta, digest, jobs=1, chunk_size=256):
+    """
+    Evaluate compatible versions of every declared version, in general and with
+    constraints of each instance, by a pool of processes if jobs > 1.
+
+    :param meta: the loaded ProductReleaseMeta.
+    :param digest: the digest of the release meta file.
+    :return: the matrix as a dict of lists, see the module comments.
+    """
+    declared = _declared_versions(meta)
+    instances = [None] + meta.get_instance_names()
+    tasks = [(instance, [str(v) for v in declared[i:i + chunk_size]])
+             for instance in instances for i in range(0, len(declared), chunk_size)]
+    if jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(jobs, _init_worker, (meta, VC.OEM_NAME))
+        try:
+            results = pool.map(_evaluate_task, tasks)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        results = [_evaluate(meta, instance, versions) for instance, versions in tasks]
+
+    evaluated = dict((i, list()) for i in instances)  # {instance: [{product: [(minv, maxv)]}]}
+    for (instance, _), result in zip(tasks, results):
+        evaluated[instance].extend(result)
+
+    # String tables
+    version_strs = set(str(v) for v in declared)
+    products = set()
+    for rows in evaluated.values():
+        for cv in rows:
+            products.update(cv)
+            for vranges in cv.values():
+                for minv, maxv in vranges:
+                    version_strs.update((minv, maxv))
+    version_strs = sorted(version_strs)
+    products = sorted(products, key=str)
+    version_index = dict((v, i) for i, v in enumerate(version_strs))
+
+    overlays = list()
+    general = evaluated[None]
+    for instance in instances:
+        rows = [i for i, cv in enumerate(evaluated[instance]) if instance is None or cv != general[i]]
+        columns = dict()
+        for p in products:
+            column = list()
+            for i in rows:
+                vranges = evaluated[instance][i].get(p)
+                column.append(None if vranges is None else
+                              [[version_index[minv], version_index[maxv]] for minv, maxv in vranges])
+            if any(cell is not None for cell in column):
+                columns[str(p)] = column
+        overlays.append({'instance': instance, 'rows': rows, 'columns': columns})
+
+    return {
+        'schema': SCHEMA,
+        'meta_digest': digest,
+        'oem': VC.OEM_NAME,
+        'versions': version_strs,
+        'releases': [version_index[str(v)] for v in declared],
+        'products': [str(p) for p in products],
+        'overlays': overlays,
+    }
+
+
+def _pack_str(buf, s):
+    data = ('' if s is None else s).encode('utf-8')
+    buf += struct.pack('<I', len(data))
+    buf += data
+
+
+def _write_binary(matrix):
+    """
+    Little-endian binary form, strings as (u32 length, utf-8 bytes) and an empty
+    instance for the general overlay:
+
+    MAGIC, u16 schema, str meta_digest, str oem,
+    u32 n, n * str versions, u32 n, n * u32 releases, u32 n, n * str products,
+    u32 n, n * overlays: str instance, u32 m, m * u32 rows, u32 k, k * columns:
+        u32 product index, m * cells: u32 n (0xFFFFFFFF for null), n * (u32 min, u32 max)
+    """
+    buf = bytearray(MAGIC)
+    buf += struct.pack('<H', matrix['schema'])
+    _pack_str(buf, matrix['meta_digest'])
+    _pack_str(buf, matrix['oem'])
+    buf += struct.pack('<I', len(matrix['versions']))
+    for v in matrix['versions']:
+        _pack_str(buf, v)
+    buf += struct.pack('<I%dI' % len(matrix['releases']), len(matrix['releases']), *matrix['releases'])
+    buf += struct.pack('<I', len(matrix['products']))
+    for p in matrix['products']:
+        _pack_str(buf, p)
+    product_index = dict((p, i) for i, p in enumerate(matrix['products']))
+    buf += struct.pack('<I', len(matrix['overlays']))
+    for overlay in matrix['overlays']:
+        _pack_str(buf, overlay['instance'])
+        rows = overlay['rows']
+        buf += struct.pack('<I%dI' % len(rows), len(rows), *rows)
+        buf += struct.pack('<I', len(overlay['columns']))
+        for p, column in sorted(overlay['columns'].items()):
+            buf += struct.pack('<I', product_index[p])
+            for cell in column:
+                if cell is None:
+                    buf += struct.pack('<I', 0xFFFFFFFF)
+                else:
+                    buf += struct.pack('<I%dI' % (2 * len(cell)), len(cell), *[i for vrange in cell for i in vrange])
+    return bytes(buf)
+
+
+class _Reader(object):
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def uint(self):
+        return self.unpack('<I')[0]
+
+    def uints(self, n):
+        return list(self.unpack('<%dI' % n))
+
+    def str(self):
+        n = self.uint()
+        s = self.data[self.offset:self.offset + n].decode('utf-8')
+        self.offset += n
+        return s
+
+
+def _read_binary(data):
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not a compatibility matrix')
+    reader = _Reader(data)
+    reader.offset = len(MAGIC)
+    schema = reader.unpack('<H')[0]
+    if schema != SCHEMA:
+        raise ValueError('Unsupported schema {} of compatibility matrix'.format(schema))
+    matrix = {'schema': schema, 'meta_digest': reader.str(), 'oem': reader.str()}
+    matrix['versions'] = [reader.str() for _ in range(reader.uint())]
+    matrix['releases'] = reader.uints(reader.uint())
+    matrix['products'] = [reader.str() for _ in range(reader.uint())]
+    matrix['overlays'] = list()
+    for _ in range(reader.uint()):
+        overlay = {'instance': reader.str() or None}
+        overlay['rows'] = reader.uints(reader.uint())
+        overlay['columns'] = dict()
+        for _ in range(reader.uint()):
+            product = matrix['products'][reader.uint()]
+            column = list()
+            for _ in overlay['rows']:
+                n = reader.uint()
+                if n == 0xFFFFFFFF:
+                    column.append(None)
+                else:
+                    flat = reader.uints(2 * n)
+                    column.append([flat[i:i + 2] for i in range(0, 2 * n, 2)])
+            overlay['columns'][product] = column
+        matrix['overlays'].append(overlay)
+    return matrix
+
+
+def write_matrix(matrix, path, binary=False):
+    """Write the matrix as json or the binary form atomically"""
+    data = _write_binary(matrix) if binary else \
+        json.dumps(matrix, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.', suffix='.tmp')
+    with os.fdopen(fd, 'wb') as of:
+        of.write(data)
+    os.replace(tmp, path)
+
+
+def load_matrix(path):
+    """Load a matrix of json or the binary form"""
+    with open(path, 'rb') as ifile:
+        data = ifile.read()
+    if data[:len(MAGIC)] == MAGIC:
+        return _read_binary(data)
+    return json.loads(data.decode('utf-8'))
+
+
+def matrix_stamp(path):
+    """Get (schema, meta_digest, oem) of a matrix file, or None if it could not be read"""
+    try:
+        with open(path, 'rb') as ifile:
+            head = ifile.read(len(MAGIC))
+            if head == MAGIC:
+                # Read the header only
+                reader = _Reader(head + ifile.read(2 + 4 + 40 + 4 + 1024))
+                reader.offset = len(MAGIC)
+                return reader.unpack('<H')[0], reader.str(), reader.str()
+        matrix = load_matrix(path)
+        return matrix.get('schema'), matrix.get('meta_digest'), matrix.get('oem')
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+class CompatibilityMatrix(object):
+    """Look up compatible versions of declared versions in a compiled matrix"""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        versions = matrix['versions']
+        self._rows = dict((versions[i], row) for row, i in enumerate(matrix['releases']))
+        # {instance: {row: {product: [(minv, maxv)]}}}
+        self._overlays = dict()
+        for overlay in matrix['overlays']:
+            cells = self._overlays[overlay['instance']] = dict((row, dict()) for row in overlay['rows'])
+            for p, column in overlay['columns'].items():
+                for row, cell in zip(overlay['rows'], column):
+                    if cell is not None:
+                        cells[row][p] = [(versions[i], versions[j]) for i, j in cell]
+
+    def lookup(self, version, instance=None):
+        """
+        Get compatible versions of a declared version as `get_compatible_versions`,
+        {product: [(minv, maxv)]} with names and versions as strings, or None if not declared.
+        """
+        row = self._rows.get(str(parse_version(version)))
+        if row is None:
+            return None
+        overlay = self._overlays.get(instance, dict())
+        if row in overlay:
+            return overlay[row]
+        return self._overlays[None][row]
@@ -0,0 +1,95 @@
+# Diagnostics of verminator runs, recorded as typed events which are formatted
+# only when summarized at the end, written out as json lines, or printed once
+# reported if echo is on.
+import json
+from collections import Counter, namedtuple
+
+from .config import Singleton
+
+__all__ = ['Diagnostic', 'diagnostics']
+
+
+class Diagnostic(namedtuple('Diagnostic', ['code', 'instance', 'major_version', 'release', 'template', 'args'])):
+    """
+    A diagnostic event of a kind (code), on a versioned instance or a release,
+    with the message formatted from template and args on request.
+    """
+    __slots__ = ()
+
+    @property
+    def message(self):
+        return self.template.format(*self.args)
+
+    def to_dict(self):
+        res = dict()
+        for key in ('code', 'instance', 'major_version', 'release'):
+            value = getattr(self, key)
+            res[key] = None if value is None else str(value)
+        res['message'] = self.message
+        return res
+
+    @classmethod
+    def from_dict(cls, dat):
+        return cls(dat['code'], dat['instance'], dat['major_version'], dat['release'], '{}', (dat['message'],))
+
+
+class Diagnostics(Singleton):
+    """The collector of diagnostic events of a run"""
+
+    def __init__(self):
+        # Print messages once reported, otherwise only summarized at the end
+        self.echo = False
+        self.events = list()
+        self.counts = Counter()
+
+    def warn(self, code, template, *args, instance=None, major_version=None, release=None):
+        """Report a warning, with message as `template.format(*args)`"""
+        self.add(Diagnostic(code, instance, major_version, release, template, args))
+
+    def add(self, event, echo=None):
+        self.events.append(event)
+        self.counts[event.code] += 1
+        if self.echo if echo is None else echo:
+            print(event.message)
+
+    def extend(self, events, echo=False):
+        """Add events reported elsewhere, e.g., by other processes, not printed by default"""
+        for event in events:
+            self.add(event, echo)
+
+    def mark(self):
+        """Get the position of the next event, see `since`"""
+        return len(self.events)
+
+    def since(self, mark):
+        return self.events[mark:]
+
+    def clear(self):
+        self.events = list()
+        self.counts = Counter()
+
+    def write_jsonl(self, stream):
+        for event in self.events:
+            stream.write(json.dumps(event.to_dict(), sort_keys=True))
+            stream.write('\n')
+
+    def summary(self, examples=0):
+        """
+        Get lines of counts of each kind of events.
+
+        :param examples: the number of messages of each kind listed under its count.
+        """
+        grouped = dict()
+        if examples > 0:
+            for event in self.events:
+                messages = grouped.setdefault(event.code, list())
+                if len(messages) < examples:
+                    messages.append(event.message)
+        lines = ['{} diagnostic(s) reported'.format(len(self.events))]
+        for code, count in sorted(self.counts.items()):
+            lines.append('  {}: {}'.format(code, count))
+            lines.extend('    ' + message for message in grouped.get(code, ()))
+        return lines
+
+
+diagnostics = Diagnostics()
@@ -0,0 +1,243 @@
+# Incremental validation which only validates instances changed since the last
+# run, or affected by changes of the release meta, recorded in a manifest file.
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from .config import verminator_config as VC
+from .diagnostics import Diagnostic, diagnostics
+from .utils import *
+from .validate_release_dep import add_versioned_releases, validate_versioned_image
+from .verminator import find_instance_images
+
+__all__ = ['MetaFingerprint', 'ValidationManifest', 'validate_instances_incrementally',
+           'scan_instance_tree_incrementally']
+
+
+def file_digest(path):
+    with open(str(path), 'rb') as ifile:
+        return hashlib.sha1(ifile.read()).hexdigest()
+
+
+def _digest(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class MetaFingerprint(object):
+    """
+    Digests of the release meta relevant to the product lines of a versioned instance.
+
+    Validating a release of product P reads the meta releases of P and the ones
+    constraining P, with all their product ranges, the sorted tdc releases and
+    the instance-specific releases. Changes elsewhere do not affect it.
+    """
+
+    def __init__(self, raw_data):
+        self._entries = dict()  # {release_name: [release entry]}
+        self._mentions = dict()  # {product: set(release_name)}
+        self._tdc_names = list()  # [(instance_name, release_name)]
+        self._instance_names = dict()  # {instance_name: set(release_name)}
+        for r in raw_data.get('Releases', list()):
+            name = r.get('release_name')
+            instance_name = r.get('instance')
+            self._entries.setdefault(name, list()).append(r)
+            self._instance_names.setdefault(instance_name, set()).add(name)
+            product = product_name(name)
+            self._mentions.setdefault(product, set()).add(name)
+            if product == VC.OEM_NAME:
+                self._tdc_names.append((instance_name, name))
+            for p in r.get('products', list()):
+                self._mentions.setdefault(product_name(p.get('min')), set()).add(name)
+
+    def digest(self, products, instance_name):
+        """Get the digest of meta releases for products of an instance"""
+        instances = (None, instance_name)
+        names = set(self._instance_names.get(instance_name, set()))
+        for p in products:
+            names.update(self._mentions.get(p, set()))
+        entries = list()
+        for name in sorted(names, key=str):
+            entries.extend(r for r in self._entries[name] if r.get('instance') in instances)
+        tdc_names = [name for i, name in self._tdc_names if i in instances]
+        return _digest([VC.OEM_NAME, entries, tdc_names])
+
+
+class ValidationManifest(object):
+    """
+    The manifest of the last validation, stored as a json file:
+
+    * validated: {instance_name: {version_folder_name: {digest, meta, diagnostics}}},
+      the digest of the validated images.yaml, the digest of relevant meta and
+      the diagnostics of validation. The diagnostics is None if validation changed
+      the file, or would change it if not dumped.
+    * scanned: {instance_name: {version_folder_name: {digest, releases}}},
+      the releases of images.yaml checked for release dependencies.
+    """
+
+    SCHEMA = 2
+
+    def __init__(self, path, options):
+        """
+        :param options: the validation options, records of different options are discarded.
+        """
+        self.path = Path(path)
+        self.options = options
+        self.validated = dict()
+        self.scanned = dict()
+        if self.path.exists():
+            with open(str(self.path)) as ifile:
+                dat = json.load(ifile)
+            if dat.get('schema') == self.SCHEMA:
+                if dat.get('options') == options:
+                    self.validated = dat.get('validated', dict())
+                self.scanned = dat.get('scanned', dict())
+
+    def save(self):
+        dat = {
+            'schema': self.SCHEMA,
+            'options': self.options,
+            'validated': self.validated,
+            'scanned': self.scanned,
+        }
+        fd, tmp = tempfile.mkstemp(dir=str(self.path.parent), suffix='.tmp')
+        with os.fdopen(fd, 'w') as of:
+            json.dump(dat, of, sort_keys=True, default=str)
+        os.replace(tmp, str(self.path))
+
+
+def _releases_products(releases):
+    return sorted(set(product_name(r['release-version']) for r in releases), key=str)
+
+
+def _replay(events):
+    diagnostics.extend([Diagnostic.from_dict(e) for e in events], diagnostics.echo)
+
+
+def validate_instances_incrementally(tree, instance_names, release_meta, manifest,
+                                     sync_releases=True, enable_terminal_constraint=False, dump=True, diff=None):
+    """
+    Validate versioned instances which are changed since the last validation or
+    affected by changes of the release meta. The diagnostics of unchanged ones are
+    reported as recorded, so the same as validating all.
+
+    :param tree: the InstanceTree, updated by dumped instances.
+    :param instance_names: names of instances to validate.
+    :param diff: a stream which unified diffs are written into if not dumping.
+    :return: the number of files changed by dumping.
+    """
+    total_changed = 0
+    fingerprint = MetaFingerprint(release_meta._raw_data)
+    scanned = manifest.scanned
+    for instance_name in instance_names:
+        instance_folder = tree.instances_folder.joinpath(instance_name)
+        if tree.omit_sample and instance_name.startswith('_'):
+            continue
+        records = manifest.validated.get(instance_name, dict())
+        digests = dict((ver, file_digest(f)) for ver, f in find_instance_images(instance_folder)
+                       if not (tree.omit_sample and ver.startswith('_')))
+
+        # Versions unchanged and not affected by meta changes
+        unchanged = dict()
+        for ver, digest in digests.items():
+            record = records.get(ver)
+            scan_record = scanned.get(instance_name, dict()).get(ver)
+            if record is None or record['digest'] != digest or record['diagnostics'] is None or \
+                    scan_record is None or scan_record['digest'] != digest:
+                continue
+            products = _releases_products(scan_record['releases'])
+            if record['meta'] == fingerprint.digest(products, instance_name):
+                unchanged[ver] = record
+
+        if set(digests) == set(unchanged) == set(records):
+            for ver in digests:
+                print(instance_folder.joinpath(ver))
+                _replay(unchanged[ver]['diagnostics'])
+            continue
+
+        images = tree.get_images(instance_name)
+        instance = tree.load_instance(instance_name)
+        instance._validate_declared_tdc_releases(release_meta)
+        validated = dict()
+        for ver, versioned_ins in instance.versioned_instances.items():
+            print(instance_folder.joinpath(ver))
+            if ver in unchanged:
+                _replay(unchanged[ver]['diagnostics'])
+                validated[ver] = unchanged[ver]
+                continue
+            mark = diagnostics.mark()
+            versioned_ins.validate_versioned_instance(release_meta, sync_releases, enable_terminal_constraint)
+            products = _releases_products(images[ver].get('releases', list()))
+            validated[ver] = {
+                'digest': digests[ver],
+                'meta': fingerprint.digest(products, instance_name),
+                'diagnostics': [e.to_dict() for e in diagnostics.since(mark)]
+            }
+
+        changed = [ver for ver in validated if ver not in unchanged]
+        if dump:
+            total_changed += instance.dump(changed)
+            tree.update(instance, changed)
+        elif diff is not None:
+            patched = instance.dump(changed, diff)
+            if patched:
+                # Dependencies are checked as patched by the diffs
+                tree.update(instance, changed, dumped=False)
+            total_changed += patched
+        for ver in changed:
+            image_file = instance_folder.joinpath(ver, 'images.yaml')
+            digest = file_digest(image_file)
+            if digest != validated[ver]['digest']:
+                # Validate the fixed file again next time
+                validated[ver]['digest'] = digest
+                validated[ver]['diagnostics'] = None
+            elif not dump and file_diff(image_file, instance.versioned_instances[ver].to_yaml()):
+                # Fixes not dumped are to be found again next time
+                validated[ver]['diagnostics'] = None
+        manifest.validated[instance_name] = validated
+    return total_changed
+
+
+def scan_instance_tree_incrementally(tree, manifest):
+    """
+    Scan instances of the tree, while versioned instances unchanged since the
+    last scanning are not loaded.
+
+    :return: the names of instances changed, added or removed since the last scanning.
+    """
+    affected = set()
+    scanned = dict()
+    for instance_path in tree.instances_folder.iterdir():
+        if not instance_path.is_dir() or \
+                (tree.omit_sample and instance_path.name.startswith('_')):
+            continue
+        instance_name = instance_path.name
+        records = manifest.scanned.get(instance_name, dict())
+        digests = [(ver, file_digest(f)) for ver, f in find_instance_images(instance_path)]
+
+        if instance_name not in tree.undumped and set(ver for ver, _ in digests) == set(records) and \
+                all(records[ver]['digest'] == digest for ver, digest in digests):
+            for ver, _ in digests:
+                add_versioned_releases(records[ver]['releases'], instance_name, ver)
+            scanned[instance_name] = records
+            continue
+
+        affected.add(instance_name)
+        images = tree.get_images(instance_name)
+        if instance_name in tree.undumped:
+            # Scanned as patched by diffs, not recorded against the files unchanged
+            for ver, _ in digests:
+                validate_versioned_image(images[ver], instance_name, ver)
+            continue
+        scanned[instance_name] = dict()
+        for ver, digest in digests:
+            validate_versioned_image(images[ver], instance_name, ver)
+            scanned[instance_name][ver] = {
+                'digest': digest,
+                'releases': images[ver].get('releases', list())
+            }
+
+    affected.update(set(manifest.scanned) - set(scanned))
+    manifest.scanned = scanned
+    return affected
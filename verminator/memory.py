@@ -0,0 +1,162 @@
+# Memory accounting of verminator runs by tracemalloc: peak and retained memory
+# of each phase, the top allocation sites and live objects of verminator classes
+# when the traced memory is high, and a soft limit of traced memory.
+import gc
+import tracemalloc
+from collections import Counter
+
+from .config import Singleton
+
+__all__ = ['MemoryLimitError', 'memory_tracker']
+
+MiB = 1024.0 * 1024
+
+
+class MemoryLimitError(MemoryError):
+    """The traced memory is beyond the soft limit"""
+    pass
+
+
+class MemoryTracker(Singleton):
+    """
+    The tracker of memory allocated by phases (see `profiler.phase`), disabled by default.
+
+    Peaks of nested phases are folded into the enclosing ones, as tracemalloc
+    keeps one peak only. Python < 3.9 could not reset the peak, so peaks of
+    phases are the peaks since tracing started there.
+    """
+
+    # Growth of traced memory to sample allocation sites and objects again
+    SAMPLE_GROWTH = 1.25
+
+    # Allocation sites kept by a sample
+    SAMPLE_SITES = 50
+
+    def __init__(self):
+        self.enabled = False
+        self.limit = None
+        self.peak = 0
+        self.phases = dict()  # {phase: [calls, max peak over the start, total retained]}
+        self.workers_peak = 0
+        # The sample at the highest traced memory
+        self.sample_size = 0
+        self.sites = list()  # [(filename, lineno, size, count)]
+        self.objects = Counter()  # {class name: count}
+        self._stack = list()  # [[traced at the start, peak so far]] of entered phases
+
+    def start(self, limit=None, frames=1):
+        """
+        Start tracing memory.
+
+        :param limit: the soft limit of traced memory in bytes, checked by phases.
+        """
+        self.enabled = True
+        self.limit = limit
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop(self):
+        if self.enabled:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            self.enabled = False
+            tracemalloc.stop()
+
+    def reset(self):
+        """Discard all collected, e.g., inherited by a forked process"""
+        self.stop()
+        self.__init__()
+
+    @staticmethod
+    def _reset_peak():
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    def enter(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak)
+        if self._stack:
+            self._stack[-1][1] = max(self._stack[-1][1], peak)
+        self._reset_peak()
+        self._stack.append([current, current])
+        self._check(current)
+
+    def exit(self, name, failed=False):
+        current, peak = tracemalloc.get_traced_memory()
+        start, top = self._stack.pop()
+        top = max(top, peak)
+        self.peak = max(self.peak, top)
+        if self._stack:
+            self._stack[-1][1] = max(self._stack[-1][1], top)
+        self._reset_peak()
+
+        stat = self.phases.setdefault(name, [0, 0, 0])
+        stat[0] += 1
+        stat[1] = max(stat[1], top - start)
+        stat[2] += current - start
+
+        if not self._stack and current > self.sample_size * self.SAMPLE_GROWTH:
+            self._sample(current)
+        if not failed:
+            self._check(current, name)
+
+    def _check(self, current, name=None):
+        if self.limit is not None and current > self.limit:
+            raise MemoryLimitError('Traced memory {:.1f} MiB is beyond the limit {:.1f} MiB{}'.format(
+                current / MiB, self.limit / MiB, '' if name is None else ' after ' + name))
+
+    def _sample(self, current):
+        """Record allocation sites and objects of verminator classes at the traced memory"""
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ))
+        self.sites = [(s.traceback[0].filename, s.traceback[0].lineno, s.size, s.count)
+                      for s in snapshot.statistics('lineno')[:self.SAMPLE_SITES]]
+        del snapshot
+        self.objects = Counter()
+        for o in gc.get_objects():
+            module = type(o).__module__
+            # Not a string for some builtin types
+            if isinstance(module, str) and module.startswith('verminator.'):
+                self.objects[type(o).__name__] += 1
+        self.sample_size = current
+
+    def take_phases(self):
+        """Get (phases, peak) collected so far and clear them, e.g., by worker processes"""
+        current, peak = tracemalloc.get_traced_memory()
+        res = self.phases, max(self.peak, peak)
+        self.phases = dict()
+        return res
+
+    def merge_phases(self, phases, peak):
+        """Merge phases taken elsewhere, see `take_phases`"""
+        for name, (calls, top, retained) in phases.items():
+            stat = self.phases.setdefault(name, [0, 0, 0])
+            stat[0] += calls
+            stat[1] = max(stat[1], top)
+            stat[2] += retained
+        self.workers_peak = max(self.workers_peak, peak)
+
+    def report(self, top=10):
+        """Get lines of memory by phases, top allocation sites and objects at the highest sample"""
+        if self.enabled:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        lines = ['Peak traced memory {:.1f} MiB'.format(self.peak / MiB)]
+        if self.workers_peak:
+            lines[0] += ', {:.1f} MiB of worker processes'.format(self.workers_peak / MiB)
+        lines.append('{:<32} {:>8} {:>14} {:>14}'.format('phase', 'calls', 'max peak KiB', 'retained KiB'))
+        for name, (calls, peak, retained) in sorted(self.phases.items(), key=lambda x: -x[1][1]):
+            lines.append('{:<32} {:>8} {:>14.1f} {:>14.1f}'.format(name, calls, peak / 1024.0, retained / 1024.0))
+        if self.sites:
+            lines.append('')
+            lines.append('Top allocation sites at {:.1f} MiB:'.format(self.sample_size / MiB))
+            for filename, lineno, size, count in self.sites[:top]:
+                lines.append('{:>10.1f} KiB {:>9} blocks  {}:{}'.format(size / 1024.0, count, filename, lineno))
+        if self.objects:
+            lines.append('')
+            lines.append('Objects of verminator classes at {:.1f} MiB:'.format(self.sample_size / MiB))
+            for name, count in self.objects.most_common(top):
+                lines.append('{:>10} {}'.format(count, name))
+        return lines
+
+
+memory_tracker = MemoryTracker()
@@ -0,0 +1,119 @@
+# Validate instances in a pool of processes, which share the release meta
+# loaded once by the main process, passed by fork or pickled otherwise.
+import io
+import multiprocessing
+import traceback
+from contextlib import redirect_stdout
+
+from .config import verminator_config as VC
+from .diagnostics import diagnostics
+from .memory import memory_tracker
+from .profiling import profiler
+from .verminator import InstanceTree
+
+__all__ = ['validate_instances_in_pool']
+
+# The release meta of worker process
+_release_meta = None
+
+
+def _init_worker(release_meta, oem_name, echo, profiling, memory_limit):
+    global _release_meta
+    _release_meta = release_meta
+    VC.set_oem(oem_name)
+    diagnostics.echo = echo
+    profiler.reset()
+    if profiling is not None:
+        profiler.enable(with_stats=profiling)
+    memory_tracker.reset()
+    if memory_limit is not None:
+        memory_tracker.start(memory_limit or None)
+
+
+def _validate_instance(task):
+    """
+    Validate an instance and dump it if required, with outputs captured.
+
+    :return: (outputs, (error, formatted traceback) if failed, images data of the instance as in the files,
+        number of files changed, unified diffs if required instead of dumping, diagnostics,
+        phase timings, cProfile stats if profiling, memory of phases if tracing)
+    """
+    instance_path, omit_sample, sync_releases, enable_terminal_constraint, dump, diff, cache = task
+    output = io.StringIO()
+    patch = io.StringIO()
+    tree = InstanceTree(instance_path.parent, omit_sample, cache)
+    changed = 0
+    diagnostics.clear()
+    profiler.clear()
+    try:
+        with redirect_stdout(output):
+            instance = tree.load_instance(instance_path.name)
+            instance.validate_instance(_release_meta, sync_releases, enable_terminal_constraint)
+            if dump:
+                changed = instance.dump()
+                tree.update(instance)
+            elif diff:
+                changed = instance.dump(diff=patch)
+                tree.update(instance, dumped=False)
+    except Exception as e:
+        return output.getvalue(), (e, traceback.format_exc()), None, changed, patch.getvalue(), diagnostics.events, \
+            profiler.timings, profiler.take_stats(), _take_memory()
+    return output.getvalue(), None, tree.get_images(instance_path.name), changed, patch.getvalue(), \
+        diagnostics.events, profiler.timings, profiler.take_stats(), _take_memory()
+
+
+def _take_memory():
+    return memory_tracker.take_phases() if memory_tracker.enabled else None
+
+
+def validate_instances_in_pool(instance_paths, release_meta, jobs, omit_sample=False,
+                               sync_releases=True, enable_terminal_constraint=False, dump=True, tree=None,
+                               diff=None):
+    """
+    Validate instances with a pool of processes.
+
+    Outputs (warnings) of each instance are printed in the order of instance paths,
+    thus the same as validating them one after another.
+
+    :param instance_paths: a list of instance folders.
+    :param release_meta: the loaded ProductReleaseMeta.
+    :param jobs: the number of worker processes.
+    :param tree: the InstanceTree updated by images data of validated instances.
+    :param diff: a stream which unified diffs are written into if not dumping.
+    :return: the number of files changed by dumping.
+    """
+    cache = tree.cache if tree is not None else None
+    tasks = [(p, omit_sample, sync_releases, enable_terminal_constraint, dump, diff is not None, cache)
+             for p in instance_paths]
+    # Workers profile as the main process does, with cProfile stats or not
+    profiling = profiler.with_stats if profiler.enabled else None
+    # Workers trace memory with the same soft limit, 0 for no limit
+    memory_limit = (memory_tracker.limit or 0) if memory_tracker.enabled else None
+    pool = multiprocessing.Pool(jobs, _init_worker, (release_meta, VC.OEM_NAME, diagnostics.echo, profiling,
+                                                     memory_limit))
+    total_changed = 0
+    try:
+        for instance_path, result in zip(instance_paths, pool.imap(_validate_instance, tasks)):
+            output, error, images, changed, patch, events, timings, stats, memory = result
+            print(output, end='')
+            # Printed in outputs already
+            diagnostics.extend(events)
+            profiler.extend(timings)
+            profiler.add_stats(stats)
+            if memory is not None:
+                memory_tracker.merge_phases(*memory)
+            total_changed += changed
+            if error is not None:
+                # The traceback of worker is lost by pickling, attached as text instead
+                error, formatted = error
+                raise RuntimeError('Failed to validate instance {}, in the worker process:\n{}'.format(
+                    instance_path.name, formatted)) from error
+            if diff is not None:
+                diff.write(patch)
+            if tree is not None:
+                tree.set_images(instance_path.name, images)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return total_changed
@@ -0,0 +1,149 @@
+# Profiling of verminator runs: wall time of each phase on each (versioned)
+# instance, and optionally cProfile stats of the whole run.
+import cProfile
+import pstats
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from .config import Singleton
+from .memory import memory_tracker
+
+__all__ = ['PhaseTiming', 'profiler']
+
+PhaseTiming = namedtuple('PhaseTiming', ['phase', 'instance', 'major_version', 'seconds'])
+
+# Phases of a versioned instance counted as its own cost, the others nest within
+# or are not specific to a versioned instance.
+VERSIONED_PHASES = ('validate', 'dump')
+
+
+class _RawStats(object):
+    """Stats collected by a profile elsewhere, e.g., other processes, as loadable by pstats"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class Profiler(Singleton):
+    """The collector of phase timings of a run, disabled by default"""
+
+    def __init__(self):
+        self.enabled = False
+        self.timings = list()
+        self._profile = None
+        self._stats = None
+
+    def enable(self, with_stats=False):
+        """Start timing phases, and profiling function calls if with_stats"""
+        self.enabled = True
+        if with_stats and self._profile is None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    @property
+    def with_stats(self):
+        """If profiling function calls"""
+        return self._profile is not None
+
+    def disable(self):
+        self.enabled = False
+        if self._profile is not None:
+            self._profile.disable()
+            self._add_stats(self._profile)
+            self._profile = None
+
+    def reset(self):
+        """Discard all collected, e.g., inherited by a forked process"""
+        if self._profile is not None:
+            self._profile.disable()
+        self.__init__()
+
+    @contextmanager
+    def phase(self, name, instance=None, major_version=None):
+        """Time the phase on an instance or a versioned instance, and track its memory if tracing"""
+        tracking = memory_tracker.enabled
+        if not self.enabled and not tracking:
+            yield
+            return
+        if tracking:
+            memory_tracker.enter()
+        start = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            if self.enabled:
+                self.timings.append(PhaseTiming(name, instance,
+                                                None if major_version is None else str(major_version),
+                                                time.perf_counter() - start))
+            if tracking:
+                memory_tracker.exit(name, failed)
+
+    def extend(self, timings):
+        """Add timings of phases elsewhere, e.g., by other processes"""
+        self.timings.extend(timings)
+
+    def clear(self):
+        self.timings = list()
+
+    def take_stats(self):
+        """Get raw cProfile stats collected so far and restart profiling, None if not profiling"""
+        if self._profile is None:
+            return None
+        self._profile.disable()
+        self._profile.create_stats()
+        stats = self._profile.stats
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        return stats
+
+    def add_stats(self, stats):
+        """Merge raw cProfile stats taken elsewhere, see `take_stats`"""
+        if stats is not None:
+            self._add_stats(_RawStats(stats))
+
+    def _add_stats(self, profile):
+        if self._stats is None:
+            self._stats = pstats.Stats(profile)
+        else:
+            self._stats.add(profile)
+
+    def dump_stats(self, path):
+        """Write the collected cProfile stats into a pstats file"""
+        if self._profile is not None:
+            self._add_stats(_RawStats(self.take_stats()))
+        if self._stats is not None:
+            self._stats.dump_stats(path)
+
+    def report(self, top=10):
+        """Get lines of the total time of each phase and the slowest versioned instances"""
+        phases = dict()  # {phase: [calls, total, max]}
+        versioned = dict()  # {(instance, major_version): seconds}
+        for t in self.timings:
+            stat = phases.setdefault(t.phase, [0, 0.0, 0.0])
+            stat[0] += 1
+            stat[1] += t.seconds
+            stat[2] = max(stat[2], t.seconds)
+            if t.phase in VERSIONED_PHASES and t.major_version is not None:
+                key = (t.instance, t.major_version)
+                versioned[key] = versioned.get(key, 0.0) + t.seconds
+
+        lines = ['{:<32} {:>8} {:>10} {:>10}'.format('phase', 'calls', 'total s', 'max s')]
+        for name, (calls, total, longest) in sorted(phases.items(), key=lambda x: -x[1][1]):
+            lines.append('{:<32} {:>8} {:>10.3f} {:>10.3f}'.format(name, calls, total, longest))
+        if versioned:
+            lines.append('')
+            lines.append('Slowest versioned instances ({}):'.format(' + '.join(VERSIONED_PHASES)))
+            lines.append('{:<32} {:>8} {:>10}'.format('instance', 'version', 'seconds'))
+            slowest = sorted(versioned.items(), key=lambda x: (-x[1], x[0]))[:top]
+            for (instance, major_version), seconds in slowest:
+                lines.append('{:<32} {:>8} {:>10.3f}'.format(instance, major_version, seconds))
+        return lines
+
+
+profiler = Profiler()
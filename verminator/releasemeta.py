@@ -10,22 +10,116 @@
 #   - {max: transwarp-5.1.0-final, min: transwarp-5.1.0-final}
 #   release_name: tdc-1.0.0-rc2
 # ************************
+from types import MappingProxyType
+
 from .config import verminator_config as VC
 from .utils import *
-import copy
 
 __all__ = ['ProductReleaseMeta']
 
 
+class _ReleaseTable(object):
+    """
+    Versioned releases {release_ver: {product: (minv, maxv)}}, indexed by products
+    for looking up DECLARED and DERIVED constraints.
+    """
+
+    def __init__(self, releases):
+        self.releases = releases
+        self._product_releases = dict()  # {product: [release_ver]}
+        for r in releases:
+            self._product_releases.setdefault(product_name(r), list()).append(r)
+        # {(product, major_projected): VersionIntervalIndex of releases constraining the product}
+        self._constraint_indexes = dict()
+
+    def products(self):
+        """Get all products constrained by the releases"""
+        return set(p for product_versions in self.releases.values() for p in product_versions)
+
+    def get_product_releases(self, product):
+        """Get releases of the product in declaration order"""
+        return self._product_releases.get(product, list())
+
+    def get_constraining_releases(self, product, version, major_projected=False):
+        """
+        Get releases of other products whose constraint on the product contains the version,
+        in declaration order.
+
+        :param major_projected: if comparing with major versions of the constraint range.
+        """
+        return self.constraint_index(product, major_projected).find(version)
+
+    def constraint_index(self, product, major_projected=False):
+        """Get the index of constraint ranges on the product, {(minv, maxv): release_ver}"""
+        key = (product, major_projected)
+        index = self._constraint_indexes.get(key)
+        if index is None:
+            entries = list()
+            for r, product_versions in self.releases.items():
+                if product_name(r) == product or product not in product_versions:
+                    continue
+                vmin, vmax = product_versions[product]
+                if major_projected:
+                    vmin, vmax = to_major_version(vmin), to_major_version(vmax)
+                entries.append((vmin, vmax, r))
+            index = self._constraint_indexes[key] = VersionIntervalIndex(entries)
+        return index
+
+
+class _TdcTimeline(object):
+    """
+    Sorted tdc releases, along with the first and last complete version of each major version.
+    """
+
+    def __init__(self, tdc_versions):
+        self.versions = sorted_versions(tdc_versions)
+        self._first = dict()  # {major_version: first complete version}
+        self._last = dict()  # {major_version: last complete version}
+        for v in self.versions:
+            major_version = to_major_version(v)
+            self._first.setdefault(major_version, v)
+            self._last[major_version] = v
+        # Major versions of other depths are equal to each other by wildcards, e.g., tdc-2 and tdc-2.0
+        self._major_depths = set(v._depth for v in self._first)
+
+    @property
+    def global_range(self):
+        return self.versions[0], self.versions[-1]
+
+    def _mapped(self, major_version):
+        return self._major_depths == {major_version._depth} and major_version in self._first
+
+    def first_of(self, major_version):
+        """Get the first complete version of the major version"""
+        if self._mapped(major_version):
+            return self._first[major_version]
+        for v in self.versions:
+            if major_version == to_major_version(v):
+                return v
+        return None
+
+    def last_of(self, major_version):
+        """Get the last complete version of the major version"""
+        if self._mapped(major_version):
+            return self._last[major_version]
+        for v in self.versions[::-1]:
+            if major_version == to_major_version(v):
+                return v
+        return None
+
+
 class ProductReleaseMeta(object):
     """ Processing `releases_meta.yaml`.
     """
 
     DEFAULT_INSTANCE_NAME = None
 
-    def __init__(self, yaml_file):
+    # Max number of cached results of `get_compatible_versions`
+    COMPATIBLE_VERSIONS_CACHE_SIZE = 8192
+
+    def __init__(self, yaml_file, cache_size=COMPATIBLE_VERSIONS_CACHE_SIZE):
         with open(yaml_file) as ifile:
-            self._raw_data = yaml.load(ifile, Loader=yaml.FullLoader)
+            self._raw_data = yaml_load(ifile)
         # -----------------------------------------------------------
         # Hierarchical version constraints, including:
         # * TDC release constraints on other product versions;
@@ -38,6 +132,22 @@ class ProductReleaseMeta(object):
         self._releases = self._load_releases()
         self._major_versioned_releases = self._load_releases(True)
 
+        # Releases merged with instance-specific ones and indexed by products,
+        # {(instance_name, major_versioned): _ReleaseTable}
+        self._release_tables = dict()
+        for major_versioned in (False, True):
+            table = self._get_release_table(self.DEFAULT_INSTANCE_NAME, major_versioned)
+            for p in table.products():
+                table.constraint_index(p)
+                table.constraint_index(p, True)
+
+        # Sorted tdc releases, {(oem_name, instance_name): _TdcTimeline}
+        self._tdc_timelines = dict()
+
+        # The meta is immutable after loading, so are the compatible versions:
+        # {(version, minor_versioned, instance_name, self_appended): {product: ((minv, maxv), ...)}}
+        self._compatible_versions_cache = LRUCache(cache_size)
+
     def _load_releases(self, major_versioned=False):
         """ Read releases meta info of product lines
         """
@@ -87,6 +197,10 @@ class ProductReleaseMeta(object):
         """
         return self._releases.get(instance_name, dict())
 
+    def get_instance_names(self):
+        """Get names of instances with specific releases declared, sorted"""
+        return sorted(i for i in self._releases if i is not self.DEFAULT_INSTANCE_NAME)
+
     def get_major_versioned_releases(self, instance_name=None):
         """
         Get all major versioned releases for specific instance_name.
@@ -100,15 +214,11 @@ class ProductReleaseMeta(object):
         """Given a specific product version,
         :return: the compatible tdc (complete) version range, (minv, maxv)
         """
-        tdc_versions = [i for i in self.get_releases(instance_name).keys()
-                        if product_name(i) == VC.OEM_NAME]
-        sorted_tdc_version = sorted(tdc_versions, key=cmp_to_key(
-            lambda x, y: x.compares(y)
-        ))
+        timeline = self._get_tdc_timeline(instance_name)
 
         rv1 = rv2 = None
         if version is None:
-            rv1, rv2 = sorted_tdc_version[0], sorted_tdc_version[-1]
+            rv1, rv2 = timeline.global_range
         else:
             # Get compatible tdc versions in a normalized way
             version = parse_version(version)
@@ -119,15 +229,7 @@ class ProductReleaseMeta(object):
             versions = list()  # [(minv, maxv)]
             for v1, v2 in pvmap.get(VC.OEM_NAME, list()):
                 if is_major_version(v1):
-                    minv, maxv = None, None
-                    for v in sorted_tdc_version:
-                        if v1 == to_major_version(v):
-                            minv = v
-                            break
-                    for v in sorted_tdc_version[::-1]:
-                        if v2 == to_major_version(v):
-                            maxv = v
-                            break
+                    minv, maxv = timeline.first_of(v1), timeline.last_of(v2)
                     if None in (minv, maxv):
                         raise ValueError('Can not get valid tdc version range for {}'.format(version))
                     versions.append((minv, maxv))
@@ -139,55 +241,99 @@ class ProductReleaseMeta(object):
 
         return None if None in (rv1, rv2) else (rv1, rv2)
 
+    def _get_tdc_timeline(self, instance_name=None):
+        """Get the sorted tdc (or oem) releases, built once for each oem name"""
+        key = (VC.OEM_NAME, instance_name)
+        timeline = self._tdc_timelines.get(key)
+        if timeline is None:
+            tdc_versions = [i for i in self.get_releases(instance_name).keys()
+                            if product_name(i) == VC.OEM_NAME]
+            timeline = self._tdc_timelines[key] = _TdcTimeline(tdc_versions)
+        return timeline
+
     def get_compatible_versions(self, version, minor_versioned=False, instance_name=None, self_appended=True):
         """
         Given a specific product version, return compatible products' version ranges.
         If the instance_name is present, more constraints on the instance would be considered.
         Otherwise, the instance-specific constraints would be ignored.
 
+        The results are cached and shared between calls, thus read-only.
+
         :param version: the product version.
         :param minor_versioned: if checking minor versions only.
         :param instance_name: the specified instance name.
         :param self_appended: if appending input version into the result.
-        :return: the compatible product version ranges, {product: [(minv, maxv)]}
+        :return: the compatible product version ranges, {product: ((minv, maxv), ...)}
         """
-        version = parse_version(version)
-        product = product_name(version)
+        key = (parse_version(version), bool(minor_versioned), instance_name, bool(self_appended))
+        compatible_versions = self._compatible_versions_cache.get(key)
+        if compatible_versions is None:
+            merged = self._get_compatible_versions(*key)
+            compatible_versions = MappingProxyType({p: tuple(vranges) for p, vranges in merged.items()})
+            self._compatible_versions_cache.put(key, compatible_versions)
+        return compatible_versions
+
+    def __getstate__(self):
+        # Cached results are read-only mappings which could not be pickled
+        state = dict(self.__dict__)
+        state['_compatible_versions_cache'] = LRUCache(self._compatible_versions_cache.maxsize)
+        return state
+
+    def _get_release_table(self, instance_name=None, major_versioned=False):
+        """
+        Get releases merged from the default and instance-specific ones.
+        The merged table of an instance is built once on first use.
+        """
+        key = (instance_name, major_versioned)
+        table = self._release_tables.get(key)
+        if table is None:
+            if not major_versioned:
+                default_releases = self.get_releases()
+            else:
+                default_releases = self.get_major_versioned_releases()
 
-        # Check that the version is complete or in major form
-        _is_major_version = is_major_version(version)
+            instance_releases = dict()
+            if instance_name is not None:
+                if not major_versioned:
+                    instance_releases = self.get_releases(instance_name=instance_name)
+                else:
+                    instance_releases = self.get_major_versioned_releases(instance_name=instance_name)
+
+            # Overlay instance-specific release meta info on the default one,
+            # which shares product versions of releases not overridden.
+            releases = dict(default_releases)
+            for r, product_versions in instance_releases.items():
+                if r not in releases:
+                    releases[r] = product_versions
+                else:
+                    default_product_versions = releases[r] = dict(releases[r])
+                    for p, vrange in product_versions.items():
+                        # Filter default product version range with declared ones, forcedly
+                        filtered = filter_vrange(default_product_versions[p], vrange)
 
-        # All declared releases in meta
-        default_releases = dict()
-        if not _is_major_version or minor_versioned:
-            default_releases = self.get_releases()
-        else:
-            default_releases = self.get_major_versioned_releases()
+                        assert filtered is not None, \
+                            'Warning: version declaration conflicts for {}: {} and {}, please fix releases_meta.yml' \
+                                .format(r, default_product_versions[p], vrange)
 
-        # Declared instance releases
-        instance_releases = dict()
-        if instance_name is not None:
-            if not _is_major_version or minor_versioned:
-                instance_releases = self.get_releases(instance_name=instance_name)
-            else:
-                instance_releases = self.get_major_versioned_releases(instance_name=instance_name)
+                        default_product_versions[p] = filtered
 
-        # Unify instance-specific and default release meta info, if present
-        releases = copy.deepcopy(default_releases)
-        for r, product_versions in instance_releases.items():
-            if r not in releases:
-                releases[r] = product_versions
-            else:
-                default_product_versions = releases[r]
-                for p, vrange in product_versions.items():
-                    # Filter default product version range with declared ones, forcedly
-                    filtered = filter_vrange(default_product_versions[p], vrange)
+            table = self._release_tables[key] = _ReleaseTable(releases)
+        return table
+
+    def cache_info(self):
+        """Get hits, misses, maxsize and currsize of the compatible versions cache"""
+        return self._compatible_versions_cache.info()
+
+    def _get_compatible_versions(self, version, minor_versioned=False, instance_name=None, self_appended=True):
+        version = parse_version(version)
+        product = product_name(version)
 
-                    assert filtered is not None, \
-                        'Warning: version declaration conflicts for {}: {} and {}, please fix releases_meta.yml' \
-                            .format(r, default_product_versions[p], vrange)
+        # Check that the version is complete or in major form
+        _is_major_version = is_major_version(version)
 
-                    default_product_versions[p] = filtered
+        # Declared releases in meta, unified with instance-specific ones if present
+        table = self._get_release_table(instance_name, _is_major_version and not minor_versioned)
+        releases = table.releases
 
         # Differentiate derived and declared constraints
         derived_constraints = {}
@@ -201,39 +347,28 @@ class ProductReleaseMeta(object):
                 store[product] = list()
             store[product].append(vrange)
 
-        # Construct constraints
-        for r, product_versions in releases.items():
-            pname = product_name(r)
-
-            # Classify candidates as DECLARED if the target product is in the releases,
-            # otherwise as DERIVED.
-            if product == pname:  # DECLARED
-                if r == version:  # Matched declared version
-                    # Update constraints
-                    add_constraint(declared_constraints, pname, (r, r))
-                    for p, vrange in product_versions.items():
-                        add_constraint(declared_constraints, p, vrange)
-
-            else:  # DERIVED
-                # Omit mismatched product-line
-                # We assume the derived are concluded from EXPLICIT dependencies.
-                # Then we always have no derived constraints for third-party instances,
-                # because instance-specific constraints are not supported yet.
-                if product not in product_versions:
-                    continue
-
-                if not _is_major_version:
-                    if not version.in_range(product_versions[product][0], product_versions[product][1]):
-                        continue  # Omit version range not containing target minor version
-                else:
-                    vmin, vmax = product_versions[product]
-                    if not version.in_range(to_major_version(vmin), to_major_version(vmax)):
-                        continue
+        # Classify candidates as DECLARED if the target product is in the releases,
+        # otherwise as DERIVED.
 
+        # DECLARED
+        for r in table.get_product_releases(product):
+            if r == version:  # Matched declared version
                 # Update constraints
-                add_constraint(derived_constraints, pname, (r, r))
-                for p, vrange in product_versions.items():
-                    add_constraint(derived_constraints, p, vrange)
+                add_constraint(declared_constraints, product, (r, r))
+                for p, vrange in releases[r].items():
+                    add_constraint(declared_constraints, p, vrange)
+
+        # DERIVED
+        # Omit mismatched product-line
+        # We assume the derived are concluded from EXPLICIT dependencies.
+        # Then we always have no derived constraints for third-party instances,
+        # because instance-specific constraints are not supported yet.
+        # Omit version range not containing target version, compared in major form if required.
+        for r in table.get_constraining_releases(product, version, _is_major_version):
+            # Update constraints
+            add_constraint(derived_constraints, product_name(r), (r, r))
+            for p, vrange in releases[r].items():
+                add_constraint(derived_constraints, p, vrange)
 
         # Merging constraints
         merged = self._merge_dd(declared_constraints, derived_constraints, _is_major_version)
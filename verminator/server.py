@@ -0,0 +1,266 @@
+# A long-running query service, which loads the release meta (and the instances
+# tree optionally) once and answers queries over a unix socket or localhost HTTP,
+# reloading once the files are changed.
+import asyncio
+import json
+import os
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+from .releasemeta import ProductReleaseMeta
+from .utils import *
+from .verminator import find_instance_images, load_instance_images
+
+__all__ = ['QueryService', 'QueryError', 'query_versions', 'serve_unix', 'serve_http']
+
+
+class QueryError(ValueError):
+    """A bad query, answered as an error"""
+    pass
+
+
+def _vrange(vrange):
+    return None if vrange is None else [str(vrange[0]), str(vrange[1])]
+
+
+def _error(e):
+    """The error answered for an exception, named by its type if unexpected, e.g., a bug"""
+    if isinstance(e, (QueryError, ValueError, AssertionError)):
+        return str(e)
+    return 'Failed to answer, {}: {}'.format(type(e).__name__, e)
+
+
+def _file_stamp(path):
+    st = os.stat(str(path))
+    return st.st_mtime_ns, st.st_size
+
+
+class _State(object):
+    """The loaded release meta and releases of instances, replaced as a whole on reloading"""
+
+    def __init__(self, meta_file, instances_folder=None):
+        self.stamps = {str(meta_file): _file_stamp(meta_file)}
+        self.meta = ProductReleaseMeta(meta_file)
+        # {release version: [(instance_name, version_folder_name, release data)]}
+        self.releases = dict()
+        if instances_folder is None:
+            return
+        for instance_path in sorted(Path(instances_folder).iterdir()):
+            if not instance_path.is_dir():
+                continue
+            for ver, image_file in find_instance_images(instance_path):
+                self.stamps[str(image_file)] = _file_stamp(image_file)
+            for ver, images in sorted(load_instance_images(instance_path).items()):
+                for r in images.get('releases', list()):
+                    key = str(parse_version(r['release-version']))
+                    self.releases.setdefault(key, list()).append((instance_path.name, ver, r))
+
+
+class QueryService(object):
+    """
+    Queries on the release meta and releases of instances, as dicts with the `op` and its arguments:
+
+    * compatible: version, instance (optional), minor_versioned (optional),
+      the compatible version ranges of products by `get_compatible_versions`;
+    * tdc-range: version (optional), instance (optional), by `get_tdc_version_range`;
+    * release: version, instance (optional), releases of the version declared by instances;
+    * status: the files loaded and the number of reloads.
+    """
+
+    def __init__(self, meta_file, instances_folder=None):
+        self.meta_file = Path(meta_file)
+        self.instances_folder = None if instances_folder is None else Path(instances_folder)
+        self.reloads = 0
+        self._state = _State(self.meta_file, self.instances_folder)
+
+    def _stamps(self):
+        """Stamps of the files to load now"""
+        stamps = {str(self.meta_file): _file_stamp(self.meta_file)}
+        if self.instances_folder is not None:
+            for instance_path in self.instances_folder.iterdir():
+                if instance_path.is_dir():
+                    for ver, image_file in find_instance_images(instance_path):
+                        stamps[str(image_file)] = _file_stamp(image_file)
+        return stamps
+
+    def reload_if_changed(self, stamps=None):
+        """
+        Reload if any file is changed, added or removed since loaded.
+        The loaded state is kept if the files could not be loaded, e.g., being written.
+
+        :param stamps: the stamps of files scanned already, scanned now if None.
+        :return: if reloaded.
+        """
+        if stamps is None:
+            stamps = self._stamps()
+        if stamps == self._state.stamps:
+            return False
+        self._state = _State(self.meta_file, self.instances_folder)
+        self.reloads += 1
+        return True
+
+    def compatible(self, version, instance=None, minor_versioned=False):
+        versions = self._state.meta.get_compatible_versions(
+            self._parse(version), minor_versioned, instance_name=instance)
+        return dict((str(p), [_vrange(v) for v in vranges]) for p, vranges in versions.items())
+
+    def tdc_range(self, version=None, instance=None):
+        version = None if version is None else self._parse(version)
+        return _vrange(self._state.meta.get_tdc_version_range(version, instance))
+
+    def release(self, version, instance=None):
+        if self.instances_folder is None:
+            raise QueryError('Instances are not loaded')
+        res = list()
+        for instance_name, ver, r in self._state.releases.get(str(self._parse(version)), list()):
+            if instance is None or instance == instance_name:
+                res.append({'instance': instance_name, 'major-version': ver, 'release': r})
+        return res
+
+    def status(self):
+        return {'meta': str(self.meta_file), 'files': len(self._state.stamps), 'reloads': self.reloads}
+
+    @staticmethod
+    def _parse(version):
+        if not version:
+            raise QueryError('A version is required')
+        try:
+            return parse_version(version)
+        except Exception as e:
+            raise QueryError('Invalid version {}: {}'.format(version, e))
+
+    def handle(self, query):
+        """Answer a query dict, with either the `result` or an `error`"""
+        ops = {
+            'compatible': lambda q: self.compatible(q.get('version'), q.get('instance'),
+                                                    q.get('minor_versioned') in (True, 'true', '1')),
+            'tdc-range': lambda q: self.tdc_range(q.get('version'), q.get('instance')),
+            'release': lambda q: self.release(q.get('version'), q.get('instance')),
+            'status': lambda q: self.status(),
+        }
+        op = query.get('op')
+        if op not in ops:
+            return {'error': 'Unknown op {}, one of {}'.format(op, ', '.join(sorted(ops)))}
+        try:
+            return {'result': ops[op](query)}
+        except Exception as e:
+            return {'error': _error(e)}
+
+
+def query_versions(service, versions, instance=None, minor_versioned=False):
+    """
+    Answer compatible versions and the tdc range of each version, e.g., lines of a file.
+    Blank lines are skipped and repeated versions are answered once only.
+
+    :return: a generator of results {version, instance, compatible, tdc_range} or {version, instance, error}.
+    """
+    answered = dict()
+    for version in versions:
+        version = version.strip()
+        if not version:
+            continue
+        res = answered.get(version)
+        if res is None:
+            res = {'version': version, 'instance': instance}
+            try:
+                res['compatible'] = service.compatible(version, instance, minor_versioned)
+                res['tdc_range'] = service.tdc_range(version, instance)
+            except Exception as e:
+                res = {'version': version, 'instance': instance, 'error': _error(e)}
+            answered[version] = res
+        yield res
+
+
+async def _watch(service, interval):
+    """
+    Reload the service once files are changed. Files are scanned out of the event loop,
+    while reloading runs on the event loop, as the version caches are not thread-safe.
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            stamps = await loop.run_in_executor(None, service._stamps)
+            if service.reload_if_changed(stamps):
+                print('Reloaded {}'.format(service.meta_file), flush=True)
+        except Exception as e:
+            print('Failed to reload, keep serving the loaded: {}'.format(e), flush=True)
+
+
+async def _handle_lines(service, reader, writer):
+    """A query as a json object each line, answered by a json line"""
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                query = json.loads(line.decode('utf-8'))
+                if not isinstance(query, dict):
+                    raise ValueError('A query should be an object')
+            except ValueError as e:
+                response = {'error': 'Invalid query: {}'.format(e)}
+            else:
+                response = service.handle(query)
+            writer.write(json.dumps(response).encode('utf-8') + b'\n')
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def _handle_http(service, reader, writer):
+    """A query as GET /<op>?<arguments>, answered by json"""
+    try:
+        request_line = await reader.readline()
+        while True:
+            header = await reader.readline()
+            if header in (b'\r\n', b'\n', b''):
+                break
+        parts = request_line.decode('latin-1').split()
+        if len(parts) < 2 or parts[0] != 'GET':
+            status, response = '405 Method Not Allowed', {'error': 'Only GET is supported'}
+        else:
+            url = urlsplit(parts[1])
+            query = dict(parse_qsl(url.query))
+            query['op'] = url.path.strip('/')
+            response = service.handle(query)
+            status = '400 Bad Request' if 'error' in response else '200 OK'
+        body = json.dumps(response).encode('utf-8')
+        writer.write('HTTP/1.1 {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                     'Connection: close\r\n\r\n'.format(status, len(body)).encode('latin-1') + body)
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+def _run(service, start_server, interval):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = loop.run_until_complete(start_server)
+    watcher = None if not interval else asyncio.ensure_future(_watch(service, interval))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+
+def serve_unix(service, path, interval=2.0):
+    """Serve queries as json lines over a unix socket, reloading every interval seconds if changed"""
+    if os.path.exists(path):
+        os.remove(path)
+    print('Serving on unix socket {}'.format(path), flush=True)
+    _run(service, asyncio.start_unix_server(lambda r, w: _handle_lines(service, r, w), path), interval)
+
+
+def serve_http(service, port, host='127.0.0.1', interval=2.0):
+    """Serve queries over http, reloading every interval seconds if changed"""
+    print('Serving on http://{}:{}'.format(host, port), flush=True)
+    _run(service, asyncio.start_server(lambda r, w: _handle_http(service, r, w), host, port), interval)
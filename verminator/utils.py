@@ -1,5 +1,10 @@
 import copy
-from collections import OrderedDict
+import difflib
+import os
+import sys
+import tempfile
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, namedtuple
 from functools import cmp_to_key
 
 import yaml
@@ -11,53 +16,352 @@ VersionMeta._v_regex = r"(?P<prefix>.*\-)?(?P<major>\d+)(?P<minor>\.\d+)?" + \
                r"(?P<maintenance>\.\d+)?(?P<build>\.\d+)?(?P<suffix_raw>\-.*)?"
 
 
-def ordered_yaml_load(yaml_path, Loader=yaml.Loader,
-                      object_pairs_hook=OrderedDict):
-    class OrderedLoader(Loader):
-        pass
+# Use libyaml based C loader and dumper if available, which are much faster
+# than the pure Python ones and produce the same outputs.
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+
+# Customized loader and dumper classes, created once per base class
+_ordered_loaders = dict()  # {(Loader, object_pairs_hook): OrderedLoader}
+_ordered_dumpers = dict()  # {Dumper: OrderedDumper}
+
+
+def yaml_load(stream, Loader=YamlLoader):
+    return yaml.load(stream, Loader)
+
+
+def _ordered_loader(Loader, object_pairs_hook):
+    key = (Loader, object_pairs_hook)
+    if key not in _ordered_loaders:
+        class OrderedLoader(Loader):
+            pass
+
+        def construct_mapping(loader, node):
+            loader.flatten_mapping(node)
+            return object_pairs_hook(loader.construct_pairs(node))
+
+        OrderedLoader.add_constructor(
+            yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
+            construct_mapping)
+        _ordered_loaders[key] = OrderedLoader
+    return _ordered_loaders[key]
+
+
+def _ordered_dumper(Dumper):
+    if Dumper not in _ordered_dumpers:
+        class OrderedDumper(Dumper):
+            pass
+
+        def _dict_representer(dumper, data):
+            return dumper.represent_mapping(
+                yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
+                data.items())
 
-    def construct_mapping(loader, node):
-        loader.flatten_mapping(node)
-        return object_pairs_hook(loader.construct_pairs(node))
+        OrderedDumper.add_representer(OrderedDict, _dict_representer)
+        _ordered_dumpers[Dumper] = OrderedDumper
+    return _ordered_dumpers[Dumper]
 
-    OrderedLoader.add_constructor(
-        yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
-        construct_mapping)
+
+def ordered_yaml_load(yaml_path, Loader=YamlLoader,
+                      object_pairs_hook=OrderedDict):
     with open(yaml_path) as stream:
-        return yaml.load(stream, OrderedLoader)
+        return yaml.load(stream, _ordered_loader(Loader, object_pairs_hook))
+
+
+def ordered_yaml_dump(data, stream=None, Dumper=YamlDumper, **kwds):
+    return yaml.dump(data, stream, _ordered_dumper(Dumper), **kwds)
 
 
-def ordered_yaml_dump(data, stream=None, Dumper=yaml.SafeDumper, **kwds):
-    class OrderedDumper(Dumper):
+def write_if_changed(path, content):
+    """
+    Write text content into a file unless it has the same content already.
+    The file is replaced atomically by a temporary file written in the same folder.
+
+    :return: True if the file is written.
+    """
+    path = str(path)
+    mode = None
+    try:
+        with open(path) as ifile:
+            if ifile.read() == content:
+                return False
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        pass
+    except (OSError, UnicodeDecodeError):
+        # Replaced by the content anyway
         pass
 
-    def _dict_representer(dumper, data):
-        return dumper.represent_mapping(
-            yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
-            data.items())
+    if mode is None:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as of:
+            of.write(content)
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return True
+
+
+def file_diff(path, content, label=None):
+    """
+    Get the unified diff from the content of a file to new text content.
+
+    :param label: the file name shown in the diff, the path by default.
+    :return: the diff text, empty if the same.
+    """
+    label = str(path) if label is None else label
+    try:
+        with open(str(path)) as ifile:
+            old = ifile.read()
+        fromfile = 'a/' + label
+    except FileNotFoundError:
+        old = ''
+        fromfile = '/dev/null'
+    if old == content:
+        return ''
+    return ''.join(difflib.unified_diff(
+        old.splitlines(True), content.splitlines(True), fromfile, 'b/' + label))
+
 
-    OrderedDumper.add_representer(OrderedDict, _dict_representer)
-    return yaml.dump(data, stream, OrderedDumper, **kwds)
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class LRUCache(object):
+    """
+    A size-bounded mapping which evicts the least recently used entries.
+
+    :param maxsize: the max number of entries kept, or None for unbounded.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = self.misses = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+
+# Fields of VersionMeta carried over when deriving a new version
+_VERSION_FIELDS = ('_raw', 'prefix', 'major', 'minor', 'maintenance',
+                   'build', '_suffix_raw', 'suffix', 'suffix_version')
+
+
+class Version(VersionMeta):
+    """
+    An immutable and hashable version, interned by `parse_version`.
+
+    All holders of the same version share one object, so it must never be
+    modified in place. Use `to_major_version` or `replace_product_name`
+    to derive a new version instead.
+    """
+
+    def __init__(self, version_str):
+        super(Version, self).__init__(version_str)
+        self._hash = hash(repr(self))
+        self._major_version = None
+        self._depth = len([i for i in (self.major, self.minor, self.maintenance, self.build)
+                           if i is not None])
+        self._sort_key = _make_sort_key(self)
+        self._frozen = True
+
+    def __setattr__(self, key, value):
+        if self.__dict__.get('_frozen', False):
+            raise AttributeError('Version {} is immutable'.format(self))
+        super(Version, self).__setattr__(key, value)
+
+    def __delattr__(self, key):
+        raise AttributeError('Version {} is immutable'.format(self))
+
+    def __hash__(self):
+        return self._hash
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return parse_version, (repr(self),)
+
+    @property
+    def sort_key(self):
+        """
+        A tuple key ordering versions like `FlexVersion.compares`.
+
+        Missing numbers of a version are skipped by `compares`, which is not
+        expressible by tuples. So the key agrees with `compares` for versions
+        of the same form (see `_key_comparable`), e.g., final and rc versions,
+        or major versions, while others are ordered deterministically with
+        major versions after their complete versions.
+        """
+        if self._sort_key is None:
+            raise ValueError('Unordered suffix {} of version {}'.format(self.suffix, self))
+        return self._sort_key
+
+    def compares(self, other, ignore_suffix=False):
+        if not ignore_suffix and _key_comparable(self, other):
+            k1, k2 = self._sort_key, other._sort_key
+            return 1 if k1 > k2 else -1 if k1 < k2 else 0
+        return super(Version, self).compares(other, ignore_suffix)
+
+    def in_range(self, minv, maxv, ignore_suffix=False):
+        if not ignore_suffix and _key_comparable(self, minv) \
+                and _key_comparable(self, maxv) and _key_comparable(minv, maxv):
+            if not (self.prefix == minv.prefix and self.prefix == maxv.prefix):
+                return False
+            if minv._sort_key > maxv._sort_key:
+                raise ValueError('The minv ({}) should be a lower/equal version against maxv ({}).'
+                                 .format(minv, maxv))
+            return minv._sort_key <= self._sort_key <= maxv._sort_key
+        return super(Version, self).in_range(minv, maxv, ignore_suffix)
+
+    @property
+    def major_version(self):
+        """The major form of version, e.g., tdc-1.2 for tdc-1.2.0-rc1"""
+        if self._major_version is None:
+            major_version = self.evolve(maintenance=None, build=None,
+                                        suffix=None, suffix_version=None)
+            self.__dict__['_major_version'] = major_version
+        return self._major_version
+
+    def evolve(self, **fields):
+        """Derive a new (interned) version with some fields replaced."""
+        version = VersionMeta.__new__(VersionMeta)
+        for field in _VERSION_FIELDS:
+            setattr(version, field, fields.get(field, getattr(self, field)))
+        return parse_version(version)
+
+    def add(self, delta, suffix=None):
+        version = VersionMeta.__new__(VersionMeta)
+        for field in _VERSION_FIELDS:
+            setattr(version, field, getattr(self, field))
+        return parse_version(VersionMeta.add(version, delta, suffix))
+
+
+def _make_sort_key(version):
+    """
+    Build the sort key (prefix, major, minor, maintenance, build, suffix rank, suffix version),
+    or None if the suffix is not ordered by `FlexVersion.ordered_suffix`.
+    """
+    ordered_suffix = FlexVersion.ordered_suffix
+    if not isinstance(ordered_suffix, list) \
+            or version.suffix not in ordered_suffix or None not in ordered_suffix:
+        return None
+    rank = ordered_suffix.index(version.suffix)
+    # Missing numbers sort around the complete ones as the suffix does against none suffix
+    missing = sys.maxsize if rank >= ordered_suffix.index(None) else -1
+    return (
+        '' if version.prefix is None else version.prefix,
+        version.major,
+        missing if version.minor is None else version.minor,
+        missing if version.maintenance is None else version.maintenance,
+        missing if version.build is None else version.build,
+        rank,
+        -1 if version.suffix_version is None else version.suffix_version,
+    )
+
+
+def _key_comparable(v1, v2):
+    """Check if sort keys of two versions agree with `FlexVersion.compares`."""
+    return isinstance(v1, Version) and isinstance(v2, Version) \
+           and v1._sort_key is not None and v2._sort_key is not None \
+           and v1._depth == v2._depth \
+           and (v1.suffix != v2.suffix or (v1.suffix_version is None) == (v2.suffix_version is None))
+
+
+# Interned versions: {version_str: Version}
+VERSION_CACHE_SIZE = 65536
+_version_cache = LRUCache(VERSION_CACHE_SIZE)
+
+
+def _intern_version(version):
+    key = repr(version) if isinstance(version, VersionMeta) else version
+    interned = _version_cache.get(key)
+    if interned is None:
+        parsed = Version(key)
+        canonical = repr(parsed)
+        interned = _version_cache.get(canonical) if canonical != key else None
+        if interned is None:
+            interned = parsed
+            _version_cache.put(canonical, interned)
+        _version_cache.put(key, interned)
+    return interned
 
 
 def parse_version(version, major_versioned=False):
+    """
+    Parse a version string into an interned `Version`.
+
+    The same object is returned for the same version, so the result is
+    shared and immutable.
+    """
     if version is None:
         return None
 
-    if not isinstance(version, VersionMeta):
-        version = FlexVersion.parse_version(version)
-    else:
-        version = copy.deepcopy(version)
+    if not isinstance(version, Version):
+        version = _intern_version(version)
 
     if major_versioned:
-        version.maintenance = None
-        version.build = None
-        version.suffix = None
-        version.suffix_version = None
+        version = version.major_version
 
     return version
 
 
+# Interned version ranges: {(id(minv), id(maxv)): (minv, maxv)}, keyed by identities
+# as equal versions may differ in forms, and kept valid by holding the versions.
+_vrange_cache = LRUCache(VERSION_CACHE_SIZE)
+
+
+def intern_vrange(minv, maxv):
+    """Get the shared (minv, maxv) tuple of versions, saving a tuple per holder of the same range."""
+    minv, maxv = parse_version(minv), parse_version(maxv)
+    key = (id(minv), id(maxv))
+    vrange = _vrange_cache.get(key)
+    if vrange is None:
+        vrange = (minv, maxv)
+        _vrange_cache.put(key, vrange)
+    return vrange
+
+
 def product_name(version):
     version = parse_version(version)
     return version.prefix
@@ -65,10 +369,8 @@ def product_name(version):
 
 def replace_product_name(version, newname, by=None):
     version = parse_version(version)
-    if by is not None and version.prefix == by:
-        version.prefix = newname
-    elif by is None:
-        version.prefix = newname
+    if by is None or version.prefix == by:
+        version = version.evolve(prefix=newname)
     return version
 
 
@@ -81,12 +383,70 @@ def is_major_version(version):
 
 
 def to_major_version(version):
-    version = parse_version(version)
-    version.maintenance = None
-    version.build = None
-    version.suffix = None
-    version.suffix_version = None
-    return version
+    return parse_version(version).major_version
+
+
+def version_key(version):
+    """The native sort key of a version, see `Version.sort_key`."""
+    return parse_version(version).sort_key
+
+
+def _ordered_by_keys(versions):
+    """
+    Check if sort keys order the versions exactly as `FlexVersion.compares` does.
+
+    Keys differ from `compares` only between versions sharing the numbers of the
+    shorter one, e.g., 5.2 and 5.2.2 are equal for `compares` as missing numbers
+    are wildcards, which is not a total order that keys can represent.
+    """
+    groups = dict()  # {prefix: [Version]}
+    for v in versions:
+        if not isinstance(v, Version) or v._sort_key is None:
+            return False
+        groups.setdefault(v.prefix, list()).append(v)
+
+    none_rank = FlexVersion.ordered_suffix.index(None)
+    for group in groups.values():
+        suffix_forms = dict()
+        for v in group:
+            form = v.suffix_version is None
+            if suffix_forms.setdefault(v.suffix, form) != form:
+                return False
+
+        depths = sorted(set(v._depth for v in group))
+        for depth in depths[:-1]:
+            shorter = dict()  # {numbers: [Version]}
+            for v in group:
+                if v._depth == depth:
+                    shorter.setdefault(v._sort_key[1:1 + depth], list()).append(v)
+            for w in group:
+                if w._depth <= depth:
+                    continue
+                for v in shorter.get(w._sort_key[1:1 + depth], list()):
+                    # Key: missing numbers of v against present ones of w
+                    by_key = 1 if v._sort_key[5] >= none_rank else -1
+                    # Compares: suffix rank, then suffix version if both present
+                    by_cmp = v._sort_key[5] - w._sort_key[5]
+                    if by_cmp == 0 and None not in (v.suffix_version, w.suffix_version):
+                        by_cmp = v.suffix_version - w.suffix_version
+                    if by_cmp == 0 or (by_cmp > 0) != (by_key > 0):
+                        return False
+    return True
+
+
+def sorted_versions(items, key=None, reverse=False):
+    """
+    Sort versions, or items with versions given by `key`, as `FlexVersion.compares` does.
+
+    Native sort keys are used unless they order the versions differently,
+    which falls back to sorting by `compares`.
+    """
+    items = list(items)
+    if key is None:
+        key = parse_version
+    if _ordered_by_keys([key(i) for i in items]):
+        return sorted(items, key=lambda i: key(i).sort_key, reverse=reverse)
+    return sorted(items, key=cmp_to_key(lambda x, y: key(x).compares(key(y))), reverse=reverse)
 
 
 def filter_vrange(this, other):
@@ -140,9 +500,7 @@ def _concatenate_vranges_with_same_prefix(vranges, hard_merging=False):
     :param hard_merging: if performing merging without considering range overlapping.
     :return: a list of concatenated version ranges, i.e. [(minv, maxv), ...]
     """
-    sorted_vranges = sorted(vranges, key=cmp_to_key(
-        lambda x, y: FlexVersion.compares(x[0], y[0])
-    ))
+    sorted_vranges = sorted_versions(vranges, key=lambda vrange: vrange[0])
 
     res = [sorted_vranges[0]]
     for vrange in sorted_vranges[1:]:
@@ -189,9 +547,270 @@ def _concatenate_vranges_with_same_prefix(vranges, hard_merging=False):
 
 
 def check_version_in_vranges_list(version, vranges):
+    """
+    Check if a version falls into any of version ranges.
+
+    :param version: the version to check.
+    :param vranges: a list of version ranges [(minv, maxv)] or a `VersionRangeSet`.
+    """
+    if isinstance(vranges, VersionRangeSet):
+        return version in vranges
     found = False
     for vrange in vranges:
         if version.in_range(vrange[0], vrange[1]):
             found = True
             break
     return found
+
+
+class _KeyBucket(object):
+    """
+    Version ranges of the same product prefix and depth, compared by sort keys
+    truncated to the depth. So versions with more numbers compare as
+    `FlexVersion.compares` does, treating the missing numbers as wildcards.
+    """
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.vranges = list()
+        # {suffix: if suffix version absent}, suffix versions are wildcards otherwise
+        self._suffix_forms = dict()
+        self._uniform = True
+
+    def key(self, version):
+        key = version._sort_key
+        return key[1:1 + self.depth] + key[5:]
+
+    def track(self, minv, maxv):
+        self.vranges.append((minv, maxv))
+        for v in (minv, maxv):
+            form = v.suffix_version is None
+            if self._suffix_forms.setdefault(v.suffix, form) != form:
+                self._uniform = False
+
+    def indexable(self, version):
+        """Check if the version can be located by its key in the bucket"""
+        return self._uniform \
+               and version._sort_key is not None \
+               and version._depth >= self.depth \
+               and self._suffix_forms.get(version.suffix, version.suffix_version is None) \
+               == (version.suffix_version is None)
+
+
+class _RangeBucket(_KeyBucket):
+    """
+    Version ranges kept as sorted and non-overlapping key intervals.
+    """
+
+    def __init__(self, depth):
+        super(_RangeBucket, self).__init__(depth)
+        self._starts = list()
+        self._ends = list()
+
+    def add(self, minv, maxv):
+        self.track(minv, maxv)
+        start, end = self.key(minv), self.key(maxv)
+        i = bisect_left(self._starts, start)
+        if i > 0 and self._ends[i - 1] >= start:
+            i -= 1
+            start = self._starts[i]
+            end = max(end, self._ends.pop(i))
+            del self._starts[i]
+        while i < len(self._starts) and self._starts[i] <= end:
+            end = max(end, self._ends.pop(i))
+            del self._starts[i]
+        self._starts.insert(i, start)
+        self._ends.insert(i, end)
+
+    def contains(self, version):
+        if not self.indexable(version):
+            return check_version_in_vranges_list(version, self.vranges)
+        key = self.key(version)
+        i = bisect_right(self._starts, key) - 1
+        return i >= 0 and key <= self._ends[i]
+
+
+class _StabbingBucket(_KeyBucket):
+    """
+    Version ranges with sequence numbers, sorted by their start keys, along with
+    running max of end keys to stop scanning backward from a version early.
+    """
+
+    def __init__(self, depth, entries):
+        super(_StabbingBucket, self).__init__(depth)
+        self._seqs = list()
+        entries = sorted(entries, key=lambda e: self.key(e[1]))
+        for seq, minv, maxv in entries:
+            self.track(minv, maxv)
+            self._seqs.append(seq)
+        self._starts = [self.key(minv) for minv, _ in self.vranges]
+        self._ends = [self.key(maxv) for _, maxv in self.vranges]
+        self._max_ends = list()
+        for end in self._ends:
+            self._max_ends.append(max(end, self._max_ends[-1]) if self._max_ends else end)
+
+    def find(self, version):
+        if not self.indexable(version):
+            return [seq for seq, (minv, maxv) in zip(self._seqs, self.vranges)
+                    if version.in_range(minv, maxv)]
+        key = self.key(version)
+        res = list()
+        i = bisect_right(self._starts, key) - 1
+        while i >= 0 and self._max_ends[i] >= key:
+            if self._ends[i] >= key:
+                res.append(self._seqs[i])
+            i -= 1
+        return res
+
+
+class VersionIntervalIndex(object):
+    """
+    An index of version ranges with payloads, finding all ranges containing
+    a version as `VersionMeta.in_range` does, by bisection over the ranges
+    of the same product prefix.
+
+    :param entries: a list of (minv, maxv, payload).
+    """
+
+    def __init__(self, entries):
+        self._payloads = list()
+        self._irregular = list()  # [(seq, minv, maxv)] out of index
+        grouped = dict()  # {(prefix, depth): [(seq, minv, maxv)]}
+        for seq, (minv, maxv, payload) in enumerate(entries):
+            minv, maxv = parse_version(minv), parse_version(maxv)
+            self._payloads.append(payload)
+            if minv.prefix != maxv.prefix:
+                continue  # No version falls into it
+            if not _key_comparable(minv, maxv) or minv.sort_key > maxv.sort_key:
+                self._irregular.append((seq, minv, maxv))
+                continue
+            grouped.setdefault((minv.prefix, minv._depth), list()).append((seq, minv, maxv))
+
+        self._buckets = dict()  # {prefix: [_StabbingBucket]}
+        for (prefix, depth), bucket_entries in grouped.items():
+            self._buckets.setdefault(prefix, list()).append(_StabbingBucket(depth, bucket_entries))
+
+    def find(self, version):
+        """Get payloads of ranges containing the version, in order of entries"""
+        version = parse_version(version)
+        seqs = [seq for seq, minv, maxv in self._irregular if version.in_range(minv, maxv)]
+        for bucket in self._buckets.get(version.prefix, list()):
+            seqs.extend(bucket.find(version))
+        return [self._payloads[seq] for seq in sorted(seqs)]
+
+
+class VersionIndex(object):
+    """
+    An index of versions, finding if any version falls into a range as
+    `VersionMeta.in_range` does, by bisection over sorted keys of the versions
+    of the same product prefix and form (see `_key_comparable`).
+    """
+
+    def __init__(self, versions):
+        self._versions = list()
+        grouped = dict()  # {prefix: {form: [Version]}}
+        for v in versions:
+            v = parse_version(v)
+            self._versions.append(v)
+            form = None if v._sort_key is None else (v._depth, v.suffix, v.suffix_version is None)
+            grouped.setdefault(v.prefix, OrderedDict()).setdefault(form, list()).append(v)
+
+        # {prefix: [(sorted keys, versions)]}, with keys None for versions out of order
+        self._groups = dict()
+        for prefix, forms in grouped.items():
+            for form, group in forms.items():
+                if form is not None:
+                    group = sorted(group, key=lambda v: v._sort_key)
+                keys = None if form is None else [v._sort_key for v in group]
+                self._groups.setdefault(prefix, list()).append((keys, group))
+
+    def __len__(self):
+        return len(self._versions)
+
+    def __iter__(self):
+        return iter(self._versions)
+
+    def any_in_range(self, minv, maxv):
+        """Check if any version falls into the range (minv, maxv)"""
+        minv, maxv = parse_version(minv), parse_version(maxv)
+        if minv.prefix != maxv.prefix:
+            return False  # No version falls into it
+        for keys, group in self._groups.get(minv.prefix, list()):
+            if keys is not None and _key_comparable(group[0], minv) \
+                    and _key_comparable(group[0], maxv) and _key_comparable(minv, maxv):
+                if minv._sort_key > maxv._sort_key:
+                    raise ValueError('The minv ({}) should be a lower/equal version against maxv ({}).'
+                                     .format(minv, maxv))
+                i = bisect_left(keys, minv._sort_key)
+                if i < len(keys) and keys[i] <= maxv._sort_key:
+                    return True
+            elif any(v.in_range(minv, maxv) for v in group):
+                return True
+        return False
+
+
+class VersionRangeSet(object):
+    """
+    A set of version ranges answering membership as `VersionMeta.in_range` does,
+    by bisection over the ranges of the same product prefix.
+
+    Ranges are indexed per product prefix and version depth (e.g., complete
+    and major versions apart). Versions missing numbers of the indexed ranges,
+    which are wildcards in `FlexVersion.compares`, are checked one by one.
+    """
+
+    def __init__(self, vranges=None):
+        self._vranges = list()
+        self._buckets = dict()  # {prefix: {depth: _RangeBucket}}
+        self._irregular = list()  # [(minv, maxv)] out of index
+        for minv, maxv in vranges or list():
+            self.add(minv, maxv)
+
+    @property
+    def vranges(self):
+        """Get a list of version ranges in form [(minv, maxv)]"""
+        return list(self._vranges)
+
+    def __iter__(self):
+        return iter(self._vranges)
+
+    def __len__(self):
+        return len(self._vranges)
+
+    def __contains__(self, version):
+        version = parse_version(version)
+        for bucket in self._buckets.get(version.prefix, dict()).values():
+            if bucket.contains(version):
+                return True
+        return check_version_in_vranges_list(version, self._irregular)
+
+    def add(self, minv, maxv):
+        """Add a version range (minv, maxv)"""
+        minv, maxv = parse_version(minv), parse_version(maxv)
+        self._vranges.append((minv, maxv))
+        if minv.prefix != maxv.prefix:
+            return  # No version falls into it
+        # Inverted ranges raise by `in_range` once versions of the product are checked
+        if not _key_comparable(minv, maxv) or minv.sort_key > maxv.sort_key:
+            self._irregular.append((minv, maxv))
+            return
+        buckets = self._buckets.setdefault(minv.prefix, dict())
+        if minv._depth not in buckets:
+            buckets[minv._depth] = _RangeBucket(minv._depth)
+        buckets[minv._depth].add(minv, maxv)
+
+    def union(self, other, hard_merging=False):
+        """Union with other version ranges, concatenated as `concatenate_vranges`"""
+        return VersionRangeSet(concatenate_vranges(self.vranges + list(other), hard_merging))
+
+    def intersection(self, other):
+        """Intersect with other version ranges of the same products, filtered as `filter_vrange`"""
+        res = list()
+        for vrange in self._vranges:
+            for ovrange in other:
+                if product_name(vrange[0]) != product_name(ovrange[0]):
+                    continue
+                filtered = filter_vrange(vrange, ovrange)
+                if filtered is not None:
+                    res.append(filtered)
+        return VersionRangeSet(res)
@@ -1,13 +1,13 @@
 #!/usr/bin/env python3
 # Module stolen from product-meta:
 # http://172.16.1.41:10080/TDC/product-meta/blob/tdc-1.2/tests/validate_instance_images.py
-from pathlib import Path
-
-import yaml
-from flex_version import FlexVersion
+from .utils import *
+from .verminator import InstanceTree
 
 
 class ReleaseDep(object):
+    __slots__ = ('type', 'max_version', 'min_version')
+
     def __init__(self, dep_desc):
         self.type = dep_desc['type']
         self.max_version = dep_desc['max-version']
@@ -15,6 +15,8 @@ class ReleaseDep(object):
 
 
 class ApplicationDep(object):
+    __slots__ = ('type', 'name', 'version')
+
     def __init__(self, name, module_name, ori_version):
         self.type = module_name
         self.name = name
@@ -22,6 +24,8 @@ class ApplicationDep(object):
 
 
 class Application(object):
+    __slots__ = ('dependencies', 'name', 'type', 'version')
+
     def __init__(self, instance, name):
         self.dependencies = list()
         self.name = name
@@ -33,6 +37,8 @@ class Application(object):
 
 
 class Product(object):
+    __slots__ = ('component', 'name', 'edition')
+
     def __init__(self, product, json_path, version):
         self.component = list()
         name = str(json_path).split('products/')[1]
@@ -47,6 +53,8 @@ class Product(object):
 
 
 class Component(object):
+    __slots__ = ('name', 'version')
+
     def __init__(self, name, version):
         self.name = name
         self.version = version
@@ -56,6 +64,11 @@ class ReleaseInfo(object):
     # All metainfo of versioned instances:
     # {instance: {version: ReleaseInfo}}
     __instance_releases = dict()
+    # Indexes of release versions of instances, built once looked up:
+    # {instance: VersionIndex}
+    __instance_indexes = dict()
+
+    __slots__ = ('instance_name', 'release_version', 'is_final', 'instance_version', 'dependencies')
 
     def __init__(self, instance_name, release_version, is_final, instance_version, dependencies=None):
         self.instance_name = instance_name
@@ -85,6 +98,7 @@ class ReleaseInfo(object):
                 release.release_version, instance_name)
             )
         cls.__instance_releases[instance_name][release.release_version] = release
+        cls.__instance_indexes.pop(instance_name, None)
 
         return release
 
@@ -92,30 +106,36 @@ class ReleaseInfo(object):
     def all_instance_releases(cls):
         return cls.__instance_releases
 
+    @classmethod
+    def clear(cls):
+        """Clear releases of all instances, e.g., to validate again in the same process"""
+        cls.__instance_releases.clear()
+        cls.__instance_indexes.clear()
+
+    @classmethod
+    def version_index(cls, instance_name):
+        """Get the index of parsed release versions of an instance"""
+        index = cls.__instance_indexes.get(instance_name)
+        if index is None:
+            versions = cls.__instance_releases.get(instance_name, dict())
+            index = cls.__instance_indexes[instance_name] = VersionIndex(versions.keys())
+        return index
+
 
 def scan_instances(root_dir, omitsample=False):
     """
     Scan all instances directories
     """
-    rp = Path(root_dir)
-    for instance in rp.iterdir():
-        if not instance.is_dir() or \
-                (omitsample and instance.name.startswith('_')):
-            continue
-        instance = instance.name
-        inspath = Path(rp.joinpath(instance))
-        versions = [x for x in inspath.iterdir() if x.is_dir()]
-        for version in versions:
-            version = version.name
-            vpath = inspath.joinpath(version)
-            imgpath = vpath.joinpath('images.yaml')
-            if not imgpath.exists():
-                # Omit subfolder without valid images yaml
-                continue
-            images = yaml.load(open(imgpath), Loader=yaml.FullLoader)
-
-            # Validate images meta info
-            validate_versioned_image(images, instance, version)
+    scan_instance_tree(InstanceTree(root_dir, omitsample))
+
+
+def scan_instance_tree(tree):
+    """
+    Scan all instances of a loaded InstanceTree
+    """
+    for instance, version, images in tree.iter_images():
+        # Validate images meta info
+        validate_versioned_image(images, instance, version)
 
 
 def validate_versioned_image(images, instance_name, instance_version):
@@ -137,40 +157,44 @@ def validate_versioned_image(images, instance_name, instance_version):
         releases[release_info.release_version] = release_info
 
     # Validate hot-fix range: each defined release should be in a hot-fix range
-    hot_fixes = images.get('hot-fix-ranges', list())
+    hot_fixes = VersionRangeSet((fix_range['min'], fix_range['max'])
+                                for fix_range in images.get('hot-fix-ranges', list()))
     for rv in releases:
-        found = False
-        for fix_range in hot_fixes:
-            if FlexVersion.in_range(rv, minv=fix_range['min'], maxv=fix_range['max']):
-                found = True
+        found = rv in hot_fixes
         assert found, 'Release version {} of {} {} not in a valid hot-fix range' \
             .format(rv, instance_name, instance_version)
 
     # Validate dependence min-max range: min <= max
     for release_info in releases.values():
         for dep in release_info.dependencies:
-            res = FlexVersion.compares(dep.min_version, dep.max_version)
+            res = parse_version(dep.min_version).compares(parse_version(dep.max_version))
             assert res <= 0, 'Invalid min-max range [min: {}, max: {}] for version {} of {} {}' \
                 .format(dep.min_version, dep.max_version, release_info.release_version, instance_name, instance_version)
 
 
+def add_versioned_releases(releases, instance_name, instance_version):
+    """
+    Add releases of a versioned instance validated before, without validating
+    its meta info again
+    """
+    print('Validating versioned instance {}, {}'.format(instance_name, instance_version))
+    for r in releases:
+        ReleaseInfo.add_release(instance_name, r, instance_version)
+
+
 def _find_a_ranged_version(instance_name, minv, maxv):
     """
     Given a version range, check if a valid version is defined in the range.
     """
-    all_instance_releases = ReleaseInfo.all_instance_releases()
-    versions = all_instance_releases.get(instance_name, dict())
-    found = False
-    for v, release_info in versions.items():
-        found = FlexVersion.in_range(v, minv, maxv)
-        if found:
-            break
-    return found
+    return ReleaseInfo.version_index(instance_name).any_in_range(minv, maxv)
 
 
-def validate_dependence_versions():
+def validate_dependence_versions(affected=None):
     """
     Each dependence should have at least a version defined.
+
+    :param affected: the names of instances changed since the last validation, whose
+        dependencies and dependents are validated only. All are validated if None.
     """
     print('Total {} instances defined'.format(len(ReleaseInfo.all_instance_releases())))
     all_instance_releases = ReleaseInfo.all_instance_releases()
@@ -184,6 +208,8 @@ def validate_dependence_versions():
                 dep_type = dep.type
                 minv = dep.min_version
                 maxv = dep.max_version
+                if affected is not None and instance_name not in affected and dep_type not in affected:
+                    continue
 
                 assert dep_type in all_instance_releases, \
                     "No dependence found {} for version {} of {}" \
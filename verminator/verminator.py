@@ -3,19 +3,126 @@
 # which has following folder structure as mapped by the data objects:
 # product-meta:
 # |__ ...
-# |__instances [class Instance]
-#    |__version1 [class VersionedInstance]
-#       |__images.yml [class Release]
+# |__instances [class InstanceTree]
+#    |__instance [class Instance]
+#       |__version1 [class VersionedInstance]
+#          |__images.yml [class Release]
 from pathlib import Path
 
+from .batch import in_range_pairs, in_ranges_matrix
 from .config import verminator_config as VC
+from .diagnostics import diagnostics
+from .profiling import profiler
 from .utils import *
 
-__all__ = ['Instance', 'VersionedInstance', 'Release']
+__all__ = ['InstanceTree', 'Instance', 'VersionedInstance', 'Release', 'Image',
+           'find_instance_images', 'load_instance_images']
+
+
+def find_instance_images(instance_folder):
+    """
+    Find images.yaml of all versions of an instance.
+
+    :return: [(version_folder_name, images.yaml path)]
+    """
+    image_files = list()
+    for ver in Path(instance_folder).iterdir():
+        image_file = ver.joinpath('images.yaml')
+        if not image_file.exists():
+            # Omit subfolder without valid images yaml
+            continue
+        image_files.append((ver.name, image_file))
+    return image_files
+
+
+def load_instance_images(instance_folder, cache=None):
+    """
+    Load images.yaml of all versions of an instance.
+
+    :param cache: a ParseCache to load unchanged files from, optional.
+    :return: {version_folder_name: images data}
+    """
+    images = dict()
+    for ver, image_file in find_instance_images(instance_folder):
+        if cache is not None:
+            images[ver] = cache.load(image_file)
+        else:
+            with open(image_file) as ifile:
+                images[ver] = yaml_load(ifile)
+    return images
+
+
+class InstanceTree(object):
+    """
+    The images data of all instances in the instances folder, which is loaded once
+    and shared by validating instances and checking release dependencies.
+    The validated instances update their dumped data in the tree instead of
+    having the files read again.
+    """
+
+    def __init__(self, instances_folder, omit_sample=False, cache=None):
+        self.instances_folder = Path(instances_folder)
+        self.omit_sample = omit_sample
+        self.cache = cache
+        self._images = dict()  # {instance_name: {version_folder_name: images data}}
+        # Names of instances updated by data not dumped into files, e.g., fixes written as diffs
+        self.undumped = set()
+
+    def get_images(self, instance_name):
+        """Get images data of an instance, {version_folder_name: images data}"""
+        if instance_name not in self._images:
+            self._images[instance_name] = load_instance_images(
+                self.instances_folder.joinpath(instance_name), self.cache)
+        return self._images[instance_name]
+
+    def set_images(self, instance_name, images):
+        self._images[instance_name] = images
+
+    def load_instance(self, instance_name):
+        """Create an Instance from the tree"""
+        instance_folder = self.instances_folder.joinpath(instance_name)
+        if self.omit_sample and instance_name.startswith('_'):
+            return Instance(instance_name, instance_folder, self.omit_sample)
+        with profiler.phase('instance-load', instance_name):
+            return Instance(instance_name, instance_folder, self.omit_sample, self.get_images(instance_name))
+
+    def update(self, instance, versions=None, dumped=True):
+        """
+        Update images data by an Instance dumped into files.
+
+        :param versions: the dumped version folder names, all if None.
+        :param dumped: if the Instance is dumped, otherwise files keep the data before
+            validation, e.g., written as diffs, and the cache is left untouched.
+        """
+        images = self.get_images(instance.instance_folder.name)
+        if not dumped:
+            self.undumped.add(instance.instance_folder.name)
+        for ver, versioned_ins in instance.versioned_instances.items():
+            if versions is not None and ver not in versions:
+                continue
+            images[ver] = versioned_ins.to_dict()
+            if dumped and self.cache is not None:
+                # Dumped files are not parsed by the next run
+                self.cache.put(instance.instance_folder.joinpath(ver, 'images.yaml'), images[ver])
+
+    def iter_images(self):
+        """Iterate over images data of all instances, as (instance_name, version_folder_name, images data)"""
+        for instance_path in self.instances_folder.iterdir():
+            if not instance_path.is_dir() or \
+                    (self.omit_sample and instance_path.name.startswith('_')):
+                continue
+            for ver, images in self.get_images(instance_path.name).items():
+                yield instance_path.name, ver, images
 
 
 class Instance(object):
-    def __init__(self, instance_type, instance_folder, omit_sample=False):
+    __slots__ = ('instance_type', 'instance_folder', 'versioned_instances')
+
+    def __init__(self, instance_type, instance_folder, omit_sample=False, images=None):
+        """
+        :param images: the loaded images data {version_folder_name: images data},
+            read from the instance folder if not present.
+        """
         self.instance_type = instance_type
         self.instance_folder = Path(instance_folder)
         self.versioned_instances = dict()  # {major_version_num: VersionedInstance}
@@ -24,17 +131,15 @@ class Instance(object):
             # Omit instance with private symbol '_'
             return
 
-        for ver in self.instance_folder.iterdir():
-            if omit_sample and ver.name.startswith('_'):
+        if images is None:
+            images = load_instance_images(self.instance_folder)
+
+        for ver, dat in images.items():
+            if omit_sample and ver.startswith('_'):
                 # Omit instance version with private symbol '_'
                 continue
-            image_file = ver.joinpath('images.yaml')
-            if not image_file.exists():
-                # Omit subfolder without valid images yaml
-                continue
-            dat = yaml.load(open(image_file), Loader=yaml.FullLoader)
             ins = VersionedInstance(**dat)
-            self.add_versioned_instance(ver.name, ins)
+            self.add_versioned_instance(ver, ins)
 
     def add_versioned_instance(self, major_version_num, instance):
         assert major_version_num not in self.versioned_instances, \
@@ -125,21 +230,71 @@ class Instance(object):
                         tdc_version, self.instance_type
                     ))
 
-    def dump(self):
+    def dump(self, versions=None, diff=None):
+        """
+        Dump versioned instances into images.yaml files.
+
+        :param versions: the version folder names to dump, all if None.
+        :param diff: a stream which unified diffs of the files are written into,
+            relative to the instances folder, instead of writing the files.
+        :return: the number of files changed, as unchanged ones are not written.
+        """
+        changed = 0
         for ver, ins in self.versioned_instances.items():
-            version_folder = self.instance_folder.joinpath(ver)
-            if not version_folder.exists():
-                version_folder.mkdir(parents=True)
-            image_file = version_folder.joinpath('images.yaml')
-            yaml_str = ins.to_yaml()
-            if yaml_str:
-                with open(image_file, 'w') as of:
-                    of.write(yaml_str)
+            if versions is not None and ver not in versions:
+                continue
+            with profiler.phase('dump', self.instance_type, ins.major_version):
+                changed += self._dump_versioned_instance(ver, ins, diff)
+        return changed
+
+    def _dump_versioned_instance(self, ver, ins, diff=None):
+        version_folder = self.instance_folder.joinpath(ver)
+        image_file = version_folder.joinpath('images.yaml')
+        yaml_str = ins.to_yaml()
+        if not yaml_str:
+            return 0
+        if diff is not None:
+            label = '{}/{}/images.yaml'.format(self.instance_folder.name, ver)
+            patch = file_diff(image_file, yaml_str, label)
+            if patch:
+                diff.write(patch)
+                return 1
+            return 0
+        if not version_folder.exists():
+            version_folder.mkdir(parents=True)
+        return 1 if write_if_changed(image_file, yaml_str) else 0
+
+
+class Image(namedtuple('Image', ['name', 'variable', 'role', 'roles'])):
+    """
+    An image declared by a versioned instance, stored as a tuple and read as
+    the dict of its fields too, e.g., image['name'] and image.items().
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        return super(Image, self).__getitem__(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self._fields else default
+
+    def keys(self):
+        return self._fields
+
+    def items(self):
+        return zip(self._fields, self)
 
 
 class VersionedInstance(object):
     """A versioned instance
     """
+    __slots__ = ('instance_type', 'major_version', '_min_tdc_version', '_max_tdc_version',
+                 '_hot_fix_ranges', '_images', '_releases')
 
     def __init__(self, **kwargs):
         self.instance_type = kwargs.get('instance-type')
@@ -163,7 +318,7 @@ class VersionedInstance(object):
         # for item in kwargs.get('hot-fix-ranges', list):
         #     self.add_hot_fix_range(item.get('min'), item.get('max'))
 
-        self._images = dict()  # {var: { name:name, role: role, roles: []}}
+        self._images = dict()  # {var: Image}
         for item in kwargs.get('images', dict()):
             self.add_image(item)
 
@@ -206,9 +361,7 @@ class VersionedInstance(object):
     def ordered_releases(self):
         """ Get a list of ordered releases by versions.
         """
-        return sorted(self._releases.values(), key=cmp_to_key(
-            lambda x, y: x.release_version.compares(y.release_version)
-        ))
+        return sorted_versions(self._releases.values(), key=lambda r: r.release_version)
 
     def add_hot_fix_range(self, _min, _max):
         """Add a new hot-fix range to VersionedInstance from raw data.
@@ -234,12 +387,7 @@ class VersionedInstance(object):
         role = image_dat.get('role', None)
         roles = image_dat.get('roles', None)
         if variable not in self._images:
-            self._images[variable] = {
-                'name': name,
-                'variable': variable,
-                'role': role,
-                'roles': roles
-            }
+            self._images[variable] = Image(name, variable, role, roles)
         else:
             raise ValueError(
                 'Duplicated image variables definitions for %s %s' % (
@@ -277,9 +425,9 @@ class VersionedInstance(object):
         """
         version = parse_version(version)
         if version in self._releases:
-            print('Warning: Duplicated new version {} for {} {}, skip'.format(
-                version, self.instance_type, self.major_version
-            ))
+            diagnostics.warn('duplicated-release', 'Warning: Duplicated new version {} for {} {}, skip',
+                             version, self.instance_type, self.major_version,
+                             instance=self.instance_type, major_version=self.major_version, release=version)
             return
 
         if from_release is None:
@@ -299,8 +447,9 @@ class VersionedInstance(object):
                 minor_release.is_final = False
                 self._releases[major_version] = minor_release
             else:
-                print('Duplicated major version {} for {}, {}, skip'.format(
-                    major_version, self.instance_type, self.major_version))
+                diagnostics.warn('duplicated-major-version', 'Duplicated major version {} for {}, {}, skip',
+                                 major_version, self.instance_type, self.major_version,
+                                 instance=self.instance_type, major_version=self.major_version, release=major_version)
 
     def convert_oem(self):
         self._min_tdc_version = replace_product_name(self._min_tdc_version, VC.OEM_NAME, VC._OEM_ORIGIN)
@@ -337,12 +486,20 @@ class VersionedInstance(object):
 
     def validate_versioned_instance(self, release_meta, sync_releases=True, enable_terminal_constraint=False):
         """Validate properties and fix errors if possible for versioned instance"""
+        with profiler.phase('validate', self.instance_type, self.major_version):
+            self._validate_versioned_instance(release_meta, sync_releases, enable_terminal_constraint)
+
+    def _validate_versioned_instance(self, release_meta, sync_releases=True, enable_terminal_constraint=False):
+        phase = lambda name: profiler.phase(name, self.instance_type, self.major_version)
+
         # Remove deprecated versions, WARP-38528
         if sync_releases:
-            self._remove_deprecated_releases(release_meta)
+            with phase('remove-deprecated-releases'):
+                self._remove_deprecated_releases(release_meta)
 
         # Update tdc min-max versions
-        self._update_tdc_minmax_version(release_meta)
+        with phase('update-tdc-minmax-version'):
+            self._update_tdc_minmax_version(release_meta)
 
         # Validate each release
         for ver, release in self._releases.items():
@@ -351,23 +508,33 @@ class VersionedInstance(object):
 
         self._validate_hot_fix_ranges()
         # self._validate_tdc_not_dependent_on_other_product_lines()  # Disable it for now
-        self._validate_releases(release_meta)
-        self._validate_terminal_images(release_meta, enable_terminal_constraint)
+        with phase('validate-releases'):
+            self._validate_releases(release_meta)
+        with phase('validate-terminal-images'):
+            self._validate_terminal_images(release_meta, enable_terminal_constraint)
 
     def _remove_deprecated_releases(self, release_meta):
         """WARP-38528: Sync instance releases with meta info while removing undeclared old releases"""
-        for release in self.ordered_releases:
+        releases = self.ordered_releases
+        # Releases paired with each declared range of their products, checked as a batch
+        owners, versions, vranges = list(), list(), list()
+        for i, release in enumerate(releases):
             compilable_versions = release_meta.get_compatible_versions(release.release_version, self_appended=False)
+            for vrange in compilable_versions.get(release.release_version.prefix, list()):
+                owners.append(i)
+                versions.append(release.release_version)
+                vranges.append(vrange)
+        founds = [False] * len(releases)
+        for i, found in zip(owners, in_range_pairs(versions, vranges)):
+            founds[i] = founds[i] or found
+
+        for release, found in zip(releases, founds):
             product = release.release_version.prefix
-            found = False
-            for vrange in compilable_versions.get(product, list()):
-                if release.release_version.in_range(vrange[0], vrange[1]):
-                    found = True
-                    break
             if product is not None and not found:
-                print('Warning: remove undeclared release {} of instance {}, {} (WARP-38528)'.format(
-                    release.release_version, self.instance_type, self.major_version
-                ))
+                diagnostics.warn('undeclared-release', 'Warning: remove undeclared release {} of instance {}, {} (WARP-38528)',
+                                 release.release_version, self.instance_type, self.major_version,
+                                 instance=self.instance_type, major_version=self.major_version,
+                                 release=release.release_version)
                 self.remove_release(release.release_version)
 
     def _update_tdc_minmax_version(self, release_meta):
@@ -384,18 +551,17 @@ class VersionedInstance(object):
             if vrange is not None:
                 tdc_vranges.append(vrange)
             else:
-                print('Warning: not found a valid tdc version range for {}, {}. Use the global range instead'
-                      .format(release.instance_type, release.release_version))
+                diagnostics.warn('tdc-range-not-found',
+                                 'Warning: not found a valid tdc version range for {}, {}. Use the global range instead',
+                                 release.instance_type, release.release_version,
+                                 instance=self.instance_type, major_version=self.major_version,
+                                 release=release.release_version)
                 if global_range is not None:
                     tdc_vranges.append(global_range)
 
         if len(tdc_vranges) > 0:
-            self._min_tdc_version = sorted([i[0] for i in tdc_vranges], key=cmp_to_key(
-                lambda x, y: x.compares(y)
-            ))[0]
-            self._max_tdc_version = sorted([i[1] for i in tdc_vranges], key=cmp_to_key(
-                lambda x, y: x.compares(y)
-            ))[-1]
+            self._min_tdc_version = sorted_versions([i[0] for i in tdc_vranges])[0]
+            self._max_tdc_version = sorted_versions([i[1] for i in tdc_vranges])[-1]
         else:
             raise ValueError('At least a valid release is required for {}, {}'.format(
                 self.instance_type, self.major_version)
@@ -404,18 +570,12 @@ class VersionedInstance(object):
     def _validate_hot_fix_ranges(self):
         """Validae hot-fix ranges for versioned instance"""
 
-        def is_version_in_hot_fix_range(version):
-            found = False
-            for _min, _max in self._hot_fix_ranges:
-                if version.in_range(_min, _max):
-                    found = True
-                    break
-            return found
-
+        hot_fix_ranges = VersionRangeSet(self._hot_fix_ranges)
         for release in self._releases.values():
             v = release.release_version
-            if not is_version_in_hot_fix_range(v):
+            if v not in hot_fix_ranges:
                 self.add_hot_fix_range(v, v)
+                hot_fix_ranges.add(v, v)
 
         # Merge continuous hot-fix ranges
         # Differentiate complete and minor-versioned-only versions
@@ -438,8 +598,10 @@ class VersionedInstance(object):
             if product == VC.OEM_NAME:
                 for dep, (minv, maxv) in release.dependencies.items():
                     if product_name(minv) != product:
-                        print('Warning: TDC should better be independent: {}, {} depends on {}'
-                              .format(release.instance_type, release.release_version, dep))
+                        diagnostics.warn('tdc-dependent', 'Warning: TDC should better be independent: {}, {} depends on {}',
+                                         release.instance_type, release.release_version, dep,
+                                         instance=self.instance_type, major_version=self.major_version,
+                                         release=release.release_version)
 
     def _validate_releases(self, release_meta):
         """Validate all releases of the instance."""
@@ -451,7 +613,7 @@ class VersionedInstance(object):
             # Get compatible version ranges for each product
             #   {product: [(minv, maxv), (minv, maxv)]}
             # WARP-34008: support instance-specific constraints
-            cv = release_meta.get_compatible_versions(r.release_version, instance_name=r.instance_type)
+            cv = dict(release_meta.get_compatible_versions(r.release_version, instance_name=r.instance_type))
 
             # Filter vrange by tdc min-max version
             _is_major_version = is_major_version(r.release_version)
@@ -465,8 +627,11 @@ class VersionedInstance(object):
                         if fv is not None:
                             filtered.append(fv)
                     if not filtered:
-                        print('Warning: Release {} of instance "{}" is filtered out by min-max tdc version.'
-                              .format(r.release_version, r.instance_type))
+                        diagnostics.warn('filtered-by-tdc-range',
+                                         'Warning: Release {} of instance "{}" is filtered out by min-max tdc version.',
+                                         r.release_version, r.instance_type,
+                                         instance=self.instance_type, major_version=self.major_version,
+                                         release=r.release_version)
                     cv[pname] = filtered
 
             # Validate the dependency versions
@@ -483,12 +648,18 @@ class VersionedInstance(object):
                         # TODO: it seems safe to merge dependency release versions
                         minv, maxv = concatenate_vranges(cv[product], hard_merging=True)[0]
                 if minv != vrange[0]:
-                    print('Warning: incompatible min version {} (should be {}) for dep "{}" of release "{}" version {}'
-                          .format(vrange[0], minv, instance, r.instance_type, r.release_version))
+                    diagnostics.warn('incompatible-min-version',
+                                     'Warning: incompatible min version {} (should be {}) for dep "{}" of release "{}" version {}',
+                                     vrange[0], minv, instance, r.instance_type, r.release_version,
+                                     instance=self.instance_type, major_version=self.major_version,
+                                     release=r.release_version)
                 if maxv != vrange[1]:
-                    print('Warning: incompatible max version {} (should be {}) for dep "{}" of release "{}" version {}'
-                          .format(vrange[1], maxv, instance, r.instance_type, r.release_version))
-                r.dependencies[instance] = (minv, maxv)
+                    diagnostics.warn('incompatible-max-version',
+                                     'Warning: incompatible max version {} (should be {}) for dep "{}" of release "{}" version {}',
+                                     vrange[1], maxv, instance, r.instance_type, r.release_version,
+                                     instance=self.instance_type, major_version=self.major_version,
+                                     release=r.release_version)
+                r.dependencies[instance] = intern_vrange(minv, maxv)
 
     def _validate_terminal_images(self, release_meta, enable_terminal_constraint=False):
         """
@@ -498,23 +669,21 @@ class VersionedInstance(object):
             # Terminal releases with constraints from plain release meta:
             # {version: {product: (vmin, vmax)}}
             release_constraints = release_meta.get_releases(self.instance_type)
-            sorted_versions = sorted(
-                release_constraints.keys(),
-                key=cmp_to_key(lambda x, y: FlexVersion.compares(x, y)),
-                reverse=True
-            )
+            ordered_versions = sorted_versions(release_constraints.keys(), reverse=True)
+            # Constraints of all terminal versions, [(terminal version, vrange)] by ordered versions
+            constraints = [(v, vrange) for v in ordered_versions for vrange in release_constraints[v].values()]
+            if enable_terminal_constraint:
+                matrix = in_ranges_matrix(self._releases.keys(), [vrange for _, vrange in constraints])
 
             # Iterate over all declared image releases in images.yaml
-            for version, release in self._releases.items():
+            for i, (version, release) in enumerate(self._releases.items()):
                 terminal_image_ver = None
                 if enable_terminal_constraint:
-                    # For TDC-2.2+, traverse all terminal constraint version
-                    for v in sorted_versions:
-                        for product, vrange in release_constraints[v].items():
-                            if version.in_range(vrange[0], vrange[1]):
-                                # We found declared terminal image mapping for other product lines
-                                terminal_image_ver = v
-                                break
+                    # For TDC-2.2+, traverse all terminal constraint version,
+                    # taking the last (lowest) one with declared terminal image mapping for other product lines
+                    for (v, vrange), found in zip(constraints, matrix[i]):
+                        if found:
+                            terminal_image_ver = v
                 else:
                     # For pre TDC-2.1, set the terminal of ArgoDB as latest TDC version
                     if version.prefix == 'argodb':
@@ -525,11 +694,17 @@ class VersionedInstance(object):
                     # Remain user defined versions
                     terminal_image_ver = version
                 else:
-                    print('WARNING: set terminal image of {} as {} (WARP-38405)'.format(version, terminal_image_ver))
+                    diagnostics.warn('terminal-image', 'WARNING: set terminal image of {} as {} (WARP-38405)',
+                                     version, terminal_image_ver,
+                                     instance=self.instance_type, major_version=self.major_version, release=version)
 
                 release.image_version['terminal_image'] = terminal_image_ver
 
     def to_yaml(self):
+        return ordered_yaml_dump(self.to_dict(), default_flow_style=False)
+
+    def to_dict(self):
+        """Get the images data as dumped into images.yaml"""
         # Ordered keys
         res = OrderedDict()
         res['instance-type'] = self.instance_type
@@ -566,12 +741,13 @@ class VersionedInstance(object):
             robj['final'] = r.is_final
             res['releases'].append(robj)
 
-        return ordered_yaml_dump(res, default_flow_style=False)
+        return res
 
 
 class Release(object):
     """ The metadata of a specific versioned release.
     """
+    __slots__ = ('instance_type', 'release_version', 'is_final', 'image_version', 'dependencies')
 
     def __init__(self, instance_type, val):
         self.instance_type = instance_type
@@ -602,7 +778,7 @@ class Release(object):
                                  (instance_type, self.instance_type,
                                   self.release_version))
             else:
-                self.dependencies[instance_type] = (_min_ver, _max_ver)
+                self.dependencies[instance_type] = intern_vrange(_min_ver, _max_ver)
 
     def convert_oem(self, oemname, by=VC._OEM_ORIGIN):
         self.release_version = replace_product_name(self.release_version, oemname, by)
@@ -610,7 +786,7 @@ class Release(object):
             self.image_version[image_name] = replace_product_name(ver, oemname, by)
         for instance, vrange in self.dependencies.items():
             minv, maxv = vrange
-            self.dependencies[instance] = (
+            self.dependencies[instance] = intern_vrange(
                 replace_product_name(minv, oemname, by),
                 replace_product_name(maxv, oemname, by)
             )
@@ -631,9 +807,9 @@ class Release(object):
                 new_release.image_version[img] = to_major_version(ver)
         for dep, (minv, maxv) in new_release.dependencies.items():
             if product_name(minv) == product_name(self.release_version):
-                new_release.dependencies[dep] = (version, version)
+                new_release.dependencies[dep] = intern_vrange(version, version)
             elif _is_major_version:
-                new_release.dependencies[dep] = (to_major_version(minv), to_major_version(maxv))
+                new_release.dependencies[dep] = intern_vrange(to_major_version(minv), to_major_version(maxv))
         return new_release
 
     def validate_tdc_minmax_version(self, minv, maxv):